@@ -1,9 +1,21 @@
-from flask import Flask, request, jsonify, render_template
+import startup  # first, so the startup clock covers the other imports
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, g
 from flask_cors import CORS
 from dotenv import load_dotenv
-from dream_journal import DreamJournalAI
+from dream_journal import JournalShards
+from llm_gateway import GeminiProvider, ProviderError, default_gateway as gateway
+from singleflight import SingleFlight, normalize
+from jobs import JobQueue, QueueFull
+from bulk_import import BulkImporter, detect_format, store_upload
+from visuals import DreamVisuals, VisualStore, FILENAME_RE, content_type
+import http_cache
+import metrics
 import os
-import google.generativeai as genai
+import json
+import time
+
+STARTUP = startup.StartupProfile()
+STARTUP.mark("imports")
 
 # Load .env
 load_dotenv()
@@ -13,17 +25,329 @@ API_KEY = os.getenv("API_KEY")
 if not API_KEY:
     raise RuntimeError("API_KEY not found! Please set it in your .env file.")
 
-genai.configure(api_key=API_KEY)
-
-# Gemini Model
-model = genai.GenerativeModel("gemini-2.5-flash")
+# Gemini Model, called through the shared provider gateway
+MODEL_NAME = "gemini-2.5-flash"
+gateway.register(GeminiProvider(api_key=API_KEY))
+
+# LLM response cache; comma-separated endpoint names in
+# LLM_CACHE_DISABLED_ROUTES (e.g. "generate_comic") always call Gemini.
+llm_cache = gateway.cache
+LLM_CACHE_DISABLED_ROUTES = {
+    route.strip() for route in os.getenv("LLM_CACHE_DISABLED_ROUTES", "").split(",") if route.strip()
+}
+
+# Concurrent identical generations share one upstream call
+inflight = SingleFlight()
+
+# Worker pool for async generations (POST with ?async=1 or "async": true)
+jobs = JobQueue(
+    workers=int(os.getenv("JOB_WORKERS", "4")),
+    max_queue=int(os.getenv("JOB_QUEUE_SIZE", "100")),
+    result_ttl=int(os.getenv("JOB_RESULT_TTL", "600")),
+    default_timeout=int(os.getenv("JOB_TIMEOUT", "120")),
+)
+
+# Uploaded bulk imports and their checkpoints; a big import can run for a while
+IMPORT_DIR = os.getenv("IMPORT_DIR", "imports")
+IMPORT_TIMEOUT = int(os.getenv("IMPORT_TIMEOUT", "3600"))
+
+# Imports get their own small pool, so long-running uploads can't take every
+# generation worker
+import_jobs = JobQueue(
+    workers=int(os.getenv("IMPORT_WORKERS", "1")),
+    max_queue=int(os.getenv("IMPORT_QUEUE_SIZE", "10")),
+    result_ttl=int(os.getenv("JOB_RESULT_TTL", "600")),
+    default_timeout=IMPORT_TIMEOUT,
+)
+
+# Locally rendered visuals, cached on disk by prompt hash; VISUAL_RENDERER
+# picks the renderer (see visuals.RENDERERS)
+visuals = DreamVisuals(VisualStore(
+    os.getenv("VISUAL_CACHE_DIR", "visual_cache"),
+    max_bytes=int(os.getenv("VISUAL_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+))
+# Visual URLs are content-addressed, so clients may keep them forever
+VISUAL_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Add a Server-Timing header (llm, journal_read, journal_write, total) to every
+# response when SERVER_TIMING=1; /metrics is always on.
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+STARTUP.mark("config")
 
 # Flask App
 app = Flask(__name__)
 CORS(app)
 
-# Dream Journal instance
-journal = DreamJournalAI()
+# Per-user journals under JOURNAL_ROOT; requests without a user id share the
+# original dream_journal.json. Journal files, the LLM and visual cache indexes
+# and provider SDK clients are all opened on first use (see create_app).
+journals = JournalShards(os.getenv("JOURNAL_ROOT", "journals"))
+journal = journals.default
+
+# Default page size for the journal page
+JOURNAL_PAGE_SIZE = 50
+
+def collect_app_metrics():
+    """Cache, coalescing and job queue counters, read when /metrics is scraped."""
+    llm = llm_cache.stats()
+    journal_cache = journals.cache_stats()
+    coalesced = inflight.stats()
+    queue = jobs.stats()
+    visual = visuals.store.stats()
+    return [
+        ("dreamweaver_llm_cache_hits_total", "counter", "LLM cache hits by tier.",
+         [({"tier": "memory"}, llm["memory_hits"]), ({"tier": "disk"}, llm["disk_hits"])]),
+        ("dreamweaver_llm_cache_misses_total", "counter", "LLM cache misses.", [({}, llm["misses"])]),
+        ("dreamweaver_llm_cache_hit_ratio", "gauge", "LLM cache hit ratio since start.",
+         [({}, llm["hit_ratio"])]),
+        ("dreamweaver_journal_cache_hits_total", "counter", "Journal read cache hits.",
+         [({}, journal_cache["hits"])]),
+        ("dreamweaver_journal_cache_misses_total", "counter", "Journal read cache misses.",
+         [({}, journal_cache["misses"])]),
+        ("dreamweaver_journal_cache_hit_ratio", "gauge", "Journal read cache hit ratio since start.",
+         [({}, journal_cache["hit_ratio"])]),
+        ("dreamweaver_generations_coalesced_total", "counter",
+         "Generations served by another request's in-flight upstream call.",
+         [({}, coalesced["upstream_calls_saved"])]),
+        ("dreamweaver_jobs_queue_depth", "gauge", "Async jobs waiting for a worker.",
+         [({}, queue["queue_depth"])]),
+        ("dreamweaver_jobs_running", "gauge", "Async jobs running.", [({}, queue["running"])]),
+        ("dreamweaver_visual_cache_hits_total", "counter", "Visuals served without rendering.",
+         [({}, visual["hits"])]),
+        ("dreamweaver_visual_cache_misses_total", "counter", "Visuals rendered.",
+         [({}, visual["misses"])]),
+        ("dreamweaver_visual_cache_bytes", "gauge", "Size of the rendered visual store.",
+         [({}, visual["bytes"])]),
+    ]
+
+metrics.REGISTRY.register_collector(collect_app_metrics)
+metrics.REGISTRY.register_collector(STARTUP.collect)
+
+def observe_request(response, url_rule, method, started):
+    """Record the request's latency by route template and attach Server-Timing if enabled."""
+    elapsed = time.perf_counter() - started
+    route = url_rule.rule if url_rule is not None else "unmatched"
+    metrics.HTTP_REQUEST_SECONDS.observe(elapsed, route, method, str(response.status_code))
+    timing = metrics.finish_request(total=elapsed)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = timing
+    return response
+
+@app.before_request
+def start_request_timing():
+    g.started = time.perf_counter()
+    metrics.start_request()
+
+@app.after_request
+def finish_request_timing(response):
+    return observe_request(response, request.url_rule, request.method, g.started)
+
+# Registered after the timing hook, so it runs first and its cost is timed
+@app.after_request
+def compress_response(response):
+    """gzip/br-encode JSON and HTML bodies for clients that accept it."""
+    if not http_cache.should_compress(response, response.is_streamed or response.direct_passthrough):
+        return response
+    body = response.get_data()
+    if len(body) < http_cache.MIN_COMPRESS_SIZE:
+        return response
+    http_cache.add_vary(response)
+    encoding = http_cache.negotiate_encoding(request.headers.get("Accept-Encoding"))
+    if encoding:
+        http_cache.apply_encoding(response, http_cache.compress(body, encoding), encoding)
+    return response
+
+def visual_response(filename, if_none_match, response_class=Response):
+    """Serve a stored visual with a strong ETag, or 304 if the client already has it."""
+    if not FILENAME_RE.match(filename):
+        return response_class("Not found", status=404)
+    etag = filename.split(".")[0]
+    headers = {"ETag": f'"{etag}"', "Cache-Control": VISUAL_CACHE_CONTROL}
+    if http_cache.etag_matches(if_none_match, etag):
+        return response_class(status=304, headers=headers)
+    data = visuals.store.read(filename)
+    if data is None:
+        # Evicted from the store; POST /generate_visual renders it again
+        return response_class("Not found", status=404)
+    return response_class(data, content_type=content_type(filename), headers=headers)
+
+def journal_etag(journal, view, args):
+    """Strong ETag for a journal view: the journal's version plus every query arg."""
+    return http_cache.make_etag(journal.version(), view, sorted(args.items(multi=True)))
+
+def encoded_response(body, encoding, mimetype, response_class=Response):
+    """
+    Response for a journal body, compressed whenever the client accepts an
+    encoding (not only above MIN_COMPRESS_SIZE): a 304 can't see the body, so
+    the 200's ETag must follow from the request alone.
+    """
+    if encoding:
+        body = http_cache.compress(body, encoding)
+    response = response_class(body, mimetype=mimetype)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+def journal_response(response, etag, encoding=None):
+    """Attach the validator; clients may keep the body but must revalidate it."""
+    response.headers["ETag"] = f'"{http_cache.encoded_etag(etag, encoding)}"'
+    response.headers["Cache-Control"] = http_cache.REVALIDATE
+    http_cache.add_vary(response)
+    return response
+
+def journal_query_args(default_limit=None, args=None):
+    """Read pagination (?limit=&after=&before=) and filter args for journal queries."""
+    args = request.args if args is None else args
+    limit = args.get("limit", type=int) or default_limit
+    return {
+        "limit": max(1, min(limit, 500)) if limit else None,
+        "after": args.get("after", type=int),
+        "before": args.get("before", type=int),
+        "mood": args.get("mood") or None,
+        "tag": args.get("tag") or None,
+        "since": args.get("since") or None,
+        "until": args.get("until") or None,
+    }
+
+def request_user_id(headers, args, data=None):
+    """User id from the X-User-Id header, ?user_id= or a JSON "user_id" field."""
+    return headers.get("X-User-Id") or args.get("user_id") or (data or {}).get("user_id")
+
+def journal_for_request(data=None):
+    """Journal shard for the requesting user; raises ValueError for a malformed id."""
+    return journals.get(request_user_id(request.headers, request.args, data))
+
+def analytics_query(journal, args):
+    """
+    Summary (and, with ?granularity=day|week|month, trend series) for
+    ?since=&until= (YYYY-MM-DD, until exclusive), answered from the journal's
+    rollups. ?tags=a,b picks the charted tags; ?top_tags= caps the defaults.
+    Raises ValueError for malformed arguments.
+    """
+    with metrics.JOURNAL_SECONDS.time("analytics_query", stage="journal_read"):
+        analytics = journal.analytics()
+        since, until = args.get("since") or None, args.get("until") or None
+        top_tags = max(1, min(args.get("top_tags", 5, type=int), 100))
+        result = {"summary": analytics.summary(since, until, top_tags)}
+        granularity = args.get("granularity")
+        if granularity:
+            tags = [t.strip() for t in args.get("tags", "").split(",") if t.strip()] or None
+            result["series"] = analytics.series(granularity, since, until, tags, top_tags)
+    return result
+
+def cache_enabled(endpoint=None):
+    """Whether the current route may use the LLM cache (stream variants share their route's setting)."""
+    endpoint = request.endpoint if endpoint is None else endpoint
+    return endpoint.removesuffix("_stream") not in LLM_CACHE_DISABLED_ROUTES
+
+def generate_text(prompt_text, use_cache):
+    """Run a Gemini prompt, serving repeats from the cache and coalescing concurrent duplicates."""
+    key = SingleFlight.make_key("gemini", MODEL_NAME, normalize(prompt_text), use_cache)
+    started = time.perf_counter()
+    text = inflight.do(key, lambda: gateway.complete(prompt_text, provider="gemini", model=MODEL_NAME,
+                                                     use_cache=use_cache))
+    metrics.record_stage("llm", time.perf_counter() - started)
+    return text
+
+def generation_error(e):
+    """
+    Response for a failed generation: 503 with Retry-After when our own LLM
+    rate limiter turned the call away (the client should just retry), else 500.
+    Returned as a dict so app.py and asgi_app.py can both use it.
+    """
+    if isinstance(e, ProviderError) and e.local:
+        return {"error": "Too many generations in progress, try again shortly."}, 503, {"Retry-After": "5"}
+    print("ERROR:", e)
+    return {"error": f"Server error: {str(e)}"}, 500
+
+def wants_async(data):
+    return request.args.get("async") == "1" or data.get("async") is True
+
+def submit_job(prompt_text, label, data):
+    """Queue a generation and return 202 with the job id to poll."""
+    use_cache = cache_enabled()
+    try:
+        priority = int(data.get("priority", 5))
+    except (TypeError, ValueError):
+        return jsonify({"error": "priority must be an integer"}), 400
+
+    def run(cancelled):
+        # A generation is a single upstream call; cancelling discards its result
+        text = generate_text(prompt_text, use_cache)
+        if not text:
+            raise RuntimeError("No response from Gemini API")
+        return {label: text}
+
+    try:
+        job = jobs.submit(run, label, priority=priority)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify({"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}), 202
+
+def sse_event(data, event=None):
+    message = f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\n{message}" if event else message
+
+def stream_text(prompt_text, label, use_cache):
+    """Yield Server-Sent Events with Gemini chunks as they arrive."""
+    started = time.perf_counter()
+    first_token = None
+    chunks = 0
+    try:
+        for text in gateway.stream(prompt_text, provider="gemini", model=MODEL_NAME,
+                                   use_cache=use_cache):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+                print(f"INFO: Gemini {label} stream ttft={first_token * 1000:.0f}ms")
+            chunks += 1
+            yield sse_event({"text": text})
+    except Exception as e:
+        print("ERROR:", e)
+        yield sse_event({"error": f"Server error: {str(e)}"}, "error")
+        return
+
+    total = time.perf_counter() - started
+    print(f"INFO: Gemini {label} stream done total={total * 1000:.0f}ms chunks={chunks}")
+    if not chunks:
+        yield sse_event({"error": "No response from Gemini API"}, "error")
+        return
+    yield sse_event({}, "done")
+
+def sse_response(events):
+    return Response(stream_with_context(events), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def dream_prompt(user_prompt):
+    return f"""
+You are DreamWeaver AI — an imaginative dream story generator.
+Create a vivid, immersive dream story based on this idea: "{user_prompt}".
+
+Requirements:
+- Make it detailed, descriptive, and poetic.
+- Minimum 300 words unless the user explicitly says they want it shorter.
+- Include surreal elements, unexpected scenes, and sensory details.
+- Write it as a single flowing narrative, not bullet points.
+- Return only the story, no extra explanation.
+
+The user’s idea: "{user_prompt}"
+
+Start the dream now:
+"""
+
+def comic_prompt(user_prompt):
+    return f"""
+You are DreamWeaver AI — an imaginative comic script writer.
+Create a short, creative comic strip script based on this dream idea: "{user_prompt}".
+
+Requirements:
+- Write it like comic panels.
+- Include short dialogues and scene directions.
+- Make it whimsical, dreamlike, or surreal.
+- Return only the comic script, no extra explanation.
+
+The idea: "{user_prompt}"
+"""
 
 # ---------- ROUTES ----------
 
@@ -37,16 +361,29 @@ def landing():
 def index():
     return render_template("index.html")
 
-# Dream Journal page (loads saved entries)
+# Dream Journal page (loads saved entries, newest first so a fresh save shows up on top)
 @app.route("/journal")
 def journal_page():
-    entries = journal.load_entries()
-    return render_template("journal.html", entries=entries)
+    try:
+        journal = journal_for_request()
+    except ValueError as e:
+        return str(e), 400
+    # Unchanged journal: skip the query and the template render
+    etag = journal_etag(journal, "page", request.args)
+    encoding = http_cache.negotiate_encoding(request.headers.get("Accept-Encoding"))
+    if http_cache.etag_matches(request.headers.get("If-None-Match"), etag):
+        return journal_response(Response(status=304), etag, encoding)
+    query = journal_query_args(default_limit=JOURNAL_PAGE_SIZE)
+    entries, next_cursor = journal.query_entries(**query, newest_first=True)
+    page = render_template("journal.html", entries=entries, next_cursor=next_cursor, filters=query,
+                           user_id=request.args.get("user_id"))
+    return journal_response(encoded_response(page.encode("utf-8"), encoding, "text/html"),
+                            etag, encoding)
 
 # Comic Generator page
 @app.route("/comic")
 def comic_page():
-    return render_template("comic_generator.html")
+    return render_template("comicgenerator.html")
 
 # Dream Visualizer page
 @app.route("/visualizer")
@@ -64,33 +401,18 @@ def generate_dream():
         if not user_prompt:
             return jsonify({"error": "No dream idea provided"}), 400
 
-        prompt_text = f"""
-You are DreamWeaver AI — an imaginative dream story generator.
-Create a vivid, immersive dream story based on this idea: "{user_prompt}".
-
-Requirements:
-- Make it detailed, descriptive, and poetic.
-- Minimum 300 words unless the user explicitly says they want it shorter.
-- Include surreal elements, unexpected scenes, and sensory details.
-- Write it as a single flowing narrative, not bullet points.
-- Return only the story, no extra explanation.
-
-The user’s idea: "{user_prompt}"
+        prompt_text = dream_prompt(user_prompt)
+        if wants_async(data):
+            return submit_job(prompt_text, "dream", data)
 
-Start the dream now:
-"""
-
-        response = model.generate_content(prompt_text)
-        print("DEBUG: Gemini dream:", response)
-
-        if not hasattr(response, "text") or not response.text:
+        text = generate_text(prompt_text, cache_enabled())
+        if not text:
             return jsonify({"error": "No response from Gemini API"}), 500
 
-        return jsonify({"dream": response.text})
+        return jsonify({"dream": text})
 
     except Exception as e:
-        print("ERROR:", e)
-        return jsonify({"error": f"Server error: {str(e)}"}), 500
+        return generation_error(e)
 
 # Generate comic script
 @app.route("/generate_comic", methods=["POST"])
@@ -101,30 +423,36 @@ def generate_comic():
         if not user_prompt:
             return jsonify({"error": "No comic idea provided"}), 400
 
-        prompt_text = f"""
-You are DreamWeaver AI — an imaginative comic script writer.
-Create a short, creative comic strip script based on this dream idea: "{user_prompt}".
+        prompt_text = comic_prompt(user_prompt)
+        if wants_async(data):
+            return submit_job(prompt_text, "comic", data)
 
-Requirements:
-- Write it like comic panels.
-- Include short dialogues and scene directions.
-- Make it whimsical, dreamlike, or surreal.
-- Return only the comic script, no extra explanation.
-
-The idea: "{user_prompt}"
-"""
-
-        response = model.generate_content(prompt_text)
-        print("DEBUG: Gemini comic:", response)
-
-        if not hasattr(response, "text") or not response.text:
+        text = generate_text(prompt_text, cache_enabled())
+        if not text:
             return jsonify({"error": "No response from Gemini API"}), 500
 
-        return jsonify({"comic": response.text})
+        return jsonify({"comic": text})
 
     except Exception as e:
-        print("ERROR:", e)
-        return jsonify({"error": f"Server error: {str(e)}"}), 500
+        return generation_error(e)
+
+# Stream a dream story as Server-Sent Events
+@app.route("/generate_dream/stream", methods=["POST"])
+def generate_dream_stream():
+    data = request.json or {}
+    user_prompt = data.get("prompt", "")
+    if not user_prompt:
+        return jsonify({"error": "No dream idea provided"}), 400
+    return sse_response(stream_text(dream_prompt(user_prompt), "dream", cache_enabled()))
+
+# Stream a comic script as Server-Sent Events
+@app.route("/generate_comic/stream", methods=["POST"])
+def generate_comic_stream():
+    data = request.json or {}
+    user_prompt = data.get("prompt", "")
+    if not user_prompt:
+        return jsonify({"error": "No comic idea provided"}), 400
+    return sse_response(stream_text(comic_prompt(user_prompt), "comic", cache_enabled()))
 
 # Generate dream visualizer image URL (mock)
 @app.route("/generate_visual", methods=["POST"])
@@ -135,15 +463,21 @@ def generate_visual():
         if not user_prompt:
             return jsonify({"error": "No visual idea provided"}), 400
 
-        # For now, return a dummy placeholder image.
-        # Replace with DALL·E or Gemini Vision later.
-        fake_image_url = f"https://dummyimage.com/800x400/000/fff&text={user_prompt.replace(' ', '+')}"
-        return jsonify({"image_url": fake_image_url})
+        # Rendered locally (once per prompt and mood) and served from /visuals
+        started = time.perf_counter()
+        filename = visuals.visual_for(user_prompt, (data.get("mood") or "").strip().lower() or None)
+        metrics.record_stage("render", time.perf_counter() - started)
+        return jsonify({"image_url": f"/visuals/{filename}"})
 
     except Exception as e:
         print("ERROR:", e)
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+# Rendered visuals
+@app.route("/visuals/<filename>", methods=["GET"])
+def serve_visual(filename):
+    return visual_response(filename, request.headers.get("If-None-Match"))
+
 # Save journal entry
 @app.route("/save_journal", methods=["POST"])
 def save_journal():
@@ -157,7 +491,14 @@ def save_journal():
         if not mood:
             return jsonify({"error": "No mood provided."}), 400
 
-        journal.save_entry(dream_text, mood)
+        try:
+            journal = journal_for_request(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        entry = journal.save_entry(dream_text, mood)
+        if entry.get("duplicate_of"):
+            return jsonify({"success": True, "duplicate_of": entry["duplicate_of"],
+                            "merged": entry.get("merged", False)})
         return jsonify({"success": True})
 
     except Exception as e:
@@ -167,8 +508,141 @@ def save_journal():
 # API to list entries
 @app.route("/journal_entries", methods=["GET"])
 def journal_entries():
-    entries = journal.load_entries()
-    return jsonify(entries)
+    try:
+        journal = journal_for_request()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # Polls of an unchanged journal get a 304 without touching the entries
+    etag = journal_etag(journal, "entries", request.args)
+    encoding = http_cache.negotiate_encoding(request.headers.get("Accept-Encoding"))
+    if http_cache.etag_matches(request.headers.get("If-None-Match"), etag):
+        return journal_response(Response(status=304), etag, encoding)
+    fields = http_cache.parse_fields(request.args.get("fields"))
+    query = journal_query_args()
+    if not any(value is not None for value in query.values()):
+        # Unfiltered listing: serve the cached, pre-serialized (and pre-compressed) journal.
+        response = Response(journal.entries_json(fields, encoding), mimetype="application/json")
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        return journal_response(response, etag, encoding)
+    entries, next_cursor = journal.query_entries(**query)
+    response = encoded_response(http_cache.json_bytes(http_cache.project(entries, fields)),
+                                encoding, "application/json")
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return journal_response(response, etag, encoding)
+
+# Mood, tag and model rollups over a date range
+@app.route("/journal_analytics", methods=["GET"])
+def journal_analytics():
+    try:
+        return jsonify(analytics_query(journal_for_request(), request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+# Bulk import dreams (JSON array, JSON Lines, CSV or TSV) as a background job.
+# Re-uploading the same file for the same user resumes an interrupted import.
+@app.route("/import_journal", methods=["POST"])
+def import_journal():
+    upload = request.files.get("file")
+    filename = upload.filename if upload else ""
+    fmt = request.args.get("format") or detect_format(filename, request.mimetype)
+    if fmt not in ("json", "jsonl", "csv", "tsv"):
+        return jsonify({"error": f"Unsupported format: {fmt}"}), 400
+    try:
+        user_id = request_user_id(request.headers, request.args, request.form)
+        journal = journals.get(user_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    path, digest = store_upload(upload.stream if upload else request.stream, IMPORT_DIR, "." + fmt)
+    checkpoint = os.path.join(IMPORT_DIR, f"{digest}.{user_id or 'default'}.checkpoint.json")
+    importer = BulkImporter(journal, lambda prompt, system_msg, max_tokens: gateway.complete(
+        prompt, system=system_msg, provider="gemini", model=MODEL_NAME, max_tokens=max_tokens,
+        temperature=0.3))
+
+    try:
+        job = import_jobs.submit(
+            lambda cancelled: importer.run(path, fmt, checkpoint, cancelled), "import")
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify({"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}), 202
+
+def find_job(job_id):
+    return jobs.get(job_id) or import_jobs.get(job_id)
+
+# Async job status and result
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = find_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(job.to_dict())
+
+# Cancel an async job
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    if not (jobs.cancel(job_id) or import_jobs.cancel(job_id)):
+        return jsonify({"error": "Job not found or already finished"}), 404
+    return jsonify(find_job(job_id).to_dict())
+
+# Queue depth and wait times, for sizing the worker pool
+@app.route("/jobs", methods=["GET"])
+def job_stats():
+    return jsonify(dict(jobs.stats(), imports=import_jobs.stats()))
+
+# Prometheus scrape endpoint
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+# Cache hit/miss and request coalescing counters
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "journal": journals.cache_stats(),
+        "llm": llm_cache.stats(),
+        "inflight": inflight.stats(),
+        "visuals": visuals.store.stats(),
+    })
+
+# Liveness/readiness probe: touches no journal, cache or provider
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok", "startup": STARTUP.summary()})
+
+def warm_up():
+    """Open everything that is otherwise built on first use, timing each step."""
+    journal.load_entries()
+    STARTUP.mark("journal")
+    llm_cache.stats()
+    visuals.store.stats()
+    STARTUP.mark("cache_index")
+    gateway.provider("gemini").client
+    STARTUP.ready("provider_client")
+
+_warmed = False
+
+def create_app(eager=None):
+    """
+    Return the configured app (e.g. `gunicorn 'app:create_app()'`).
+
+    By default nothing slow happens before the first request that needs it,
+    so a new worker passes /healthz right away; eager=True (or EAGER_INIT=1)
+    warms the journal, caches and provider client up front instead.
+    """
+    global _warmed
+    if eager is None:
+        eager = os.getenv("EAGER_INIT", "0") == "1"
+    if eager and not _warmed:
+        warm_up()
+        _warmed = True
+    return app
+
+STARTUP.ready("routes")
+if os.getenv("STARTUP_PROFILE", "0") == "1":
+    print("INFO:", STARTUP.report())
 
 if __name__ == "__main__":
+    create_app()
     app.run(debug=True)
@@ -0,0 +1,201 @@
+"""
+Async (ASGI) serving mode for the DreamWeaver API.
+
+Serves the generation and journal endpoints as async handlers, so a pending
+Gemini call holds a coroutine instead of a thread and one process can keep
+thousands of generations waiting on the upstream API. Journal file I/O runs
+in worker threads. Configuration, the journal, the LLM cache and request
+coalescing are shared with app.py; the Flask app keeps working on its own
+for simple deployments.
+
+Run with:
+    hypercorn asgi_app:app --bind 0.0.0.0:5000
+"""
+import asyncio
+import time
+
+from quart import Quart, request, jsonify, Response, g
+from quart_cors import cors
+
+import http_cache
+import metrics
+from app import (MODEL_NAME, gateway, inflight, journals, cache_enabled, journal_query_args,
+                 request_user_id, dream_prompt, comic_prompt, observe_request, visuals,
+                 visual_response, analytics_query, journal_etag, journal_response, STARTUP,
+                 create_app, generation_error, encoded_response)
+from singleflight import SingleFlight, normalize
+
+app = cors(Quart(__name__))
+create_app()  # honours EAGER_INIT for the shared resources
+
+
+@app.before_request
+async def start_request_timing():
+    g.started = time.perf_counter()
+    metrics.start_request()
+
+
+@app.after_request
+async def finish_request_timing(response):
+    return observe_request(response, request.url_rule, request.method, g.started)
+
+
+@app.after_request
+async def compress_response(response):
+    """gzip/br-encode JSON and HTML bodies for clients that accept it."""
+    streamed = not isinstance(response.response, response.data_body_class)
+    if not http_cache.should_compress(response, streamed):
+        return response
+    body = await response.get_data()
+    if len(body) < http_cache.MIN_COMPRESS_SIZE:
+        return response
+    http_cache.add_vary(response)
+    encoding = http_cache.negotiate_encoding(request.headers.get("Accept-Encoding"))
+    if encoding:
+        http_cache.apply_encoding(response, await asyncio.to_thread(http_cache.compress, body, encoding),
+                                  encoding)
+    return response
+
+
+async def generate_text(prompt_text, use_cache):
+    """Async generate_text: awaits Gemini, sharing the cache and in-flight calls with app.py."""
+    key = SingleFlight.make_key("gemini", MODEL_NAME, normalize(prompt_text), use_cache)
+    started = time.perf_counter()
+    text = await inflight.do_async(key, lambda: gateway.acomplete(
+        prompt_text, provider="gemini", model=MODEL_NAME, use_cache=use_cache))
+    metrics.record_stage("llm", time.perf_counter() - started)
+    return text
+
+
+async def generate(label, build_prompt, missing_error):
+    try:
+        data = await request.get_json()
+        user_prompt = data.get("prompt", "")
+        if not user_prompt:
+            return jsonify({"error": missing_error}), 400
+
+        text = await generate_text(build_prompt(user_prompt), cache_enabled(request.endpoint))
+        if not text:
+            return jsonify({"error": "No response from Gemini API"}), 500
+
+        return jsonify({label: text})
+
+    except Exception as e:
+        return generation_error(e)
+
+# ---------- API ENDPOINTS ----------
+
+# Generate dream story
+@app.route("/generate_dream", methods=["POST"])
+async def generate_dream():
+    return await generate("dream", dream_prompt, "No dream idea provided")
+
+# Generate comic script
+@app.route("/generate_comic", methods=["POST"])
+async def generate_comic():
+    return await generate("comic", comic_prompt, "No comic idea provided")
+
+# Generate dream visualizer image URL (mock)
+@app.route("/generate_visual", methods=["POST"])
+async def generate_visual():
+    try:
+        data = await request.get_json()
+        user_prompt = data.get("prompt", "")
+        if not user_prompt:
+            return jsonify({"error": "No visual idea provided"}), 400
+
+        started = time.perf_counter()
+        filename = await asyncio.to_thread(
+            visuals.visual_for, user_prompt, (data.get("mood") or "").strip().lower() or None)
+        metrics.record_stage("render", time.perf_counter() - started)
+        return jsonify({"image_url": f"/visuals/{filename}"})
+
+    except Exception as e:
+        print("ERROR:", e)
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+# Rendered visuals
+@app.route("/visuals/<filename>", methods=["GET"])
+async def serve_visual(filename):
+    return await asyncio.to_thread(visual_response, filename, request.headers.get("If-None-Match"),
+                                   Response)
+
+# Save journal entry
+@app.route("/save_journal", methods=["POST"])
+async def save_journal():
+    try:
+        data = await request.get_json()
+        dream_text = data.get("dream", "").strip()
+        mood = data.get("mood", "").strip()
+
+        if not dream_text:
+            return jsonify({"error": "No dream text provided."}), 400
+        if not mood:
+            return jsonify({"error": "No mood provided."}), 400
+
+        try:
+            user_id = request_user_id(request.headers, request.args, data)
+            journal = await asyncio.to_thread(journals.get, user_id)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        entry = await asyncio.to_thread(journal.save_entry, dream_text, mood)
+        if entry.get("duplicate_of"):
+            return jsonify({"success": True, "duplicate_of": entry["duplicate_of"],
+                            "merged": entry.get("merged", False)})
+        return jsonify({"success": True})
+
+    except Exception as e:
+        print("ERROR:", e)
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+# API to list entries
+@app.route("/journal_entries", methods=["GET"])
+async def journal_entries():
+    try:
+        user_id = request_user_id(request.headers, request.args)
+        journal = await asyncio.to_thread(journals.get, user_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    etag = await asyncio.to_thread(journal_etag, journal, "entries", request.args)
+    encoding = http_cache.negotiate_encoding(request.headers.get("Accept-Encoding"))
+    if http_cache.etag_matches(request.headers.get("If-None-Match"), etag):
+        return journal_response(Response("", status=304), etag, encoding)
+    fields = http_cache.parse_fields(request.args.get("fields"))
+    query = journal_query_args(args=request.args)
+    if not any(value is not None for value in query.values()):
+        body = await asyncio.to_thread(journal.entries_json, fields, encoding)
+        response = Response(body, mimetype="application/json")
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        return journal_response(response, etag, encoding)
+    entries, next_cursor = await asyncio.to_thread(lambda: journal.query_entries(**query))
+    response = await asyncio.to_thread(
+        encoded_response, http_cache.json_bytes(http_cache.project(entries, fields)), encoding,
+        "application/json", Response)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return journal_response(response, etag, encoding)
+
+# Mood, tag and model rollups over a date range
+@app.route("/journal_analytics", methods=["GET"])
+async def journal_analytics():
+    try:
+        user_id = request_user_id(request.headers, request.args)
+        journal = await asyncio.to_thread(journals.get, user_id)
+        return jsonify(await asyncio.to_thread(analytics_query, journal, request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+# Liveness/readiness probe
+@app.route("/healthz", methods=["GET"])
+async def healthz():
+    return jsonify({"status": "ok", "startup": STARTUP.summary()})
+
+# Prometheus scrape endpoint (same registry as app.py)
+@app.route("/metrics", methods=["GET"])
+async def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
@@ -0,0 +1,418 @@
+"""
+Offline benchmarks for DreamWeaver.
+
+Runs without API keys: Gemini and Groq are replaced by a deterministic
+FakeProvider with a configurable latency distribution. Two suites:
+
+  endpoints  throughput and p50/p95/p99 latency of each app.py endpoint
+             (or asgi_app.py with --server asgi) under concurrent load
+  journal    save_entry, load_entries, search_journal and get_statistics
+             against synthetic journals of each --sizes entry count
+
+Everything runs in a scratch directory, and results are written as JSON.
+Pass --compare with an earlier results file to print the change per metric.
+
+    python benchmark.py --sizes 1000,100000 --output bench.json
+    python benchmark.py --compare bench.json --output bench2.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR)
+
+from journal_store import write_json_atomic  # noqa: E402
+from llm_cache import LLMCache  # noqa: E402
+from llm_gateway import FakeProvider, default_gateway  # noqa: E402
+
+MOODS = ["happy", "sad", "anxious", "peaceful", "confused", "excited", "scared", "nostalgic"]
+WORDS = """
+water ocean river rain flood swimming drowning boat island shore falling flying floating
+climbing running chasing hiding searching lost trapped escape door window hallway stairs
+house school office hospital forest mountain desert city street bridge tunnel cave garden
+mother father sister brother friend stranger teacher child baby crowd shadow monster dog
+cat bird snake horse wolf spider fish teeth hair mirror phone car train plane elevator
+exam late naked wedding funeral party dinner letter key money clock fire smoke storm snow
+moon stars night darkness light colors music voice silence laughter crying screaming
+dancing singing painting reading writing memory childhood future past strange familiar
+ancient glowing broken empty endless tiny enormous golden silver purple invisible
+""".split()
+QUERIES = ["water", "flying over the ocean", "lost in a house", "teeth falling",
+           "chased by a shadow", "fly*", '"old house"', "exam late school", "snake garden",
+           "mother childhood memory"]
+
+
+# ---------- latency distributions ----------
+
+def latency_distribution(spec, seed=0):
+    """
+    Parse a latency spec into a callable returning seconds.
+
+    Specs: "none", "fixed:S", "uniform:LO:HI", "lognormal:MEDIAN:SIGMA"
+    (all in seconds).
+    """
+    kind, *params = spec.split(":")
+    params = [float(p) for p in params]
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def draw(fn):
+        def sample():
+            with lock:
+                return fn()
+        return sample
+
+    if kind == "none":
+        return 0.0
+    if kind == "fixed" and len(params) == 1:
+        return params[0]
+    if kind == "uniform" and len(params) == 2:
+        return draw(lambda: rng.uniform(*params))
+    if kind == "lognormal" and len(params) == 2:
+        median, sigma = params
+        return draw(lambda: rng.lognormvariate(math.log(median), sigma))
+    raise ValueError(f"Bad latency spec: {spec}")
+
+
+# ---------- measurement ----------
+
+def summarize(latencies, elapsed=None, errors=0):
+    """Latency percentiles (ms) and throughput for one benchmark."""
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return 1000 * ordered[min(len(ordered) - 1, int(math.ceil(p / 100 * len(ordered))) - 1)]
+
+    result = {"count": len(ordered), "errors": errors}
+    if ordered:
+        result.update({
+            "mean_ms": 1000 * sum(ordered) / len(ordered),
+            "p50_ms": pct(50),
+            "p95_ms": pct(95),
+            "p99_ms": pct(99),
+            "max_ms": 1000 * ordered[-1],
+        })
+    if elapsed:
+        result["elapsed_s"] = elapsed
+        result["throughput_rps"] = len(ordered) / elapsed
+    return result
+
+
+def timed(fn, repeat):
+    """Call fn() `repeat` times sequentially and summarize."""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(repeat):
+        t = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def synthetic_entries(n, seed=0):
+    """Deterministic journal entries, oldest first, readable by both journal classes."""
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    entries = []
+    for i in range(n):
+        words = rng.choices(WORDS, k=rng.randint(30, 80))
+        entries.append({
+            "timestamp": (start + timedelta(minutes=7 * i)).isoformat(),
+            "text": " ".join(words),
+            "analysis": "This dream shows your inner thoughts and emotions.",
+            "tags": sorted(set(rng.sample(words, 4))),
+            "mood": rng.choice(MOODS),
+            "model_used": "fake",
+        })
+    return entries
+
+
+def synthetic_dream(i, seed=0):
+    """Dream text i: far enough from every other one that dedup never merges or links them."""
+    return " ".join(random.Random(f"{seed}:{i}").choices(WORDS, k=40))
+
+
+# ---------- endpoint suite ----------
+
+def endpoint_cases(prompt_pool):
+    """(name, method, path, json body factory) for every app.py endpoint."""
+    def prompt(kind):
+        def body(i):
+            return {"prompt": f"{kind} idea {i % prompt_pool if prompt_pool else i}"}
+        return body
+
+    return [
+        ("landing", "GET", "/", None),
+        ("app_page", "GET", "/app", None),
+        ("journal_page", "GET", "/journal", None),
+        ("comic_page", "GET", "/comic", None),
+        ("visualizer_page", "GET", "/visualizer", None),
+        ("generate_dream", "POST", "/generate_dream", prompt("dream")),
+        ("generate_comic", "POST", "/generate_comic", prompt("comic")),
+        ("generate_dream_stream", "POST", "/generate_dream/stream", prompt("dream stream")),
+        ("generate_comic_stream", "POST", "/generate_comic/stream", prompt("comic stream")),
+        ("generate_visual", "POST", "/generate_visual", prompt("visual")),
+        ("save_journal", "POST", "/save_journal",
+         lambda i: {"dream": synthetic_dream(i), "mood": MOODS[i % len(MOODS)]}),
+        ("journal_entries", "GET", "/journal_entries", None),
+        ("journal_entries_filtered", "GET", "/journal_entries?limit=50&mood=happy", None),
+        ("jobs", "GET", "/jobs", None),
+        ("cache_stats", "GET", "/cache_stats", None),
+    ]
+
+
+def bench_flask(cases, requests, concurrency):
+    import app as flask_app
+
+    local = threading.local()
+
+    def call(case, i):
+        _, method, path, body = case
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = flask_app.app.test_client()
+        t = time.perf_counter()
+        response = client.open(path, method=method, json=body(i) if body else None)
+        response.get_data()  # drain streamed responses
+        return time.perf_counter() - t, response.status_code < 400
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for case in cases:
+            started = time.perf_counter()
+            outcomes = list(pool.map(lambda i: call(case, i), range(requests)))
+            elapsed = time.perf_counter() - started
+            results[case[0]] = summarize([t for t, _ in outcomes], elapsed,
+                                         errors=sum(not ok for _, ok in outcomes))
+            print(f"INFO: {case[0]}: {results[case[0]]['throughput_rps']:.0f} req/s, "
+                  f"p95 {results[case[0]]['p95_ms']:.1f} ms")
+    return results
+
+
+def bench_asgi(cases, requests, concurrency):
+    import asgi_app
+
+    routes = {rule.rule for rule in asgi_app.app.url_map.iter_rules()}
+    cases = [case for case in cases if case[2].split("?")[0] in routes]
+
+    async def run():
+        client = asgi_app.app.test_client()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def call(case, i):
+            _, method, path, body = case
+            async with slots:
+                t = time.perf_counter()
+                response = await client.open(path, method=method, json=body(i) if body else None)
+                await response.get_data()
+                return time.perf_counter() - t, response.status_code < 400
+
+        results = {}
+        for case in cases:
+            started = time.perf_counter()
+            outcomes = await asyncio.gather(*(call(case, i) for i in range(requests)))
+            elapsed = time.perf_counter() - started
+            results[case[0]] = summarize([t for t, _ in outcomes], elapsed,
+                                         errors=sum(not ok for _, ok in outcomes))
+            print(f"INFO: {case[0]}: {results[case[0]]['throughput_rps']:.0f} req/s, "
+                  f"p95 {results[case[0]]['p95_ms']:.1f} ms")
+        return results
+
+    return asyncio.run(run())
+
+
+def run_endpoints(args, workdir):
+    os.chdir(os.path.join(workdir, "endpoints"))
+    write_json_atomic("dream_journal.json", synthetic_entries(args.endpoint_journal_size, args.seed))
+
+    import app  # noqa: F401  (registers the real Gemini provider, replaced below)
+
+    fake = FakeProvider(latency=latency_distribution(args.latency, args.seed), seed=args.seed,
+                        failure_rate=args.failure_rate, name="gemini")
+    limit = max(args.concurrency, 8)
+    default_gateway.register(fake, rate=1e9, burst=limit, max_concurrency=limit)
+
+    cases = endpoint_cases(args.prompt_pool)
+    print(f"INFO: endpoints ({args.server}): {args.requests} requests x {len(cases)} routes, "
+          f"concurrency {args.concurrency}")
+    if args.server == "asgi":
+        results = bench_asgi(cases, args.requests, args.concurrency)
+    else:
+        results = bench_flask(cases, args.requests, args.concurrency)
+    return {"server": args.server, "upstream_calls": fake.calls, "routes": results}
+
+
+# ---------- journal suite ----------
+
+def bench_journal_size(n, args, workdir):
+    from dream_journal import DreamJournalAI as WebJournal
+    import main as cli_main
+
+    directory = os.path.join(workdir, f"journal-{n}")
+    os.makedirs(directory)
+    os.chdir(directory)
+
+    t = time.perf_counter()
+    entries = synthetic_entries(n, args.seed)
+    write_json_atomic("dream_journal.json", entries, indent=None)
+    del entries
+    print(f"INFO: journal {n}: synthetic journal written in {time.perf_counter() - t:.1f}s")
+    result = {}
+
+    # CLI journal (main.py): build indexes once, then search and statistics
+    default_gateway.register(FakeProvider(name="groq", seed=args.seed), rate=1e9, burst=64,
+                             max_concurrency=64)
+    cli = cli_main.DreamJournalAI(api_key="offline", model=cli_main.DEFAULT_MODEL)
+    t = time.perf_counter()
+    cli.load_journal()
+    result["load_journal_cold"] = summarize([time.perf_counter() - t])
+    result["search_journal"] = timed(lambda i: cli.search_journal(QUERIES[i % len(QUERIES)]),
+                                     args.ops)
+    result["get_statistics"] = timed(lambda i: cli.get_statistics(), args.ops)
+    result["get_statistics_rebuild"] = timed(
+        lambda i: cli.stats.rebuild(cli.journal_entries), max(1, min(args.ops, 3)))
+    del cli
+
+    # Web journal (dream_journal.py): cold and cached loads, then appends
+    web = WebJournal(backend=args.backend)
+    t = time.perf_counter()
+    web.load_entries()
+    result["load_entries_cold"] = summarize([time.perf_counter() - t])
+    result["load_entries_cached"] = timed(lambda i: web.load_entries(), args.ops)
+    result["save_entry"] = timed(
+        lambda i: web.save_entry(synthetic_dream(i, args.seed + 1), MOODS[i % len(MOODS)]),
+        args.ops)
+    t = time.perf_counter()
+    web.load_entries()
+    result["load_entries_after_save"] = summarize([time.perf_counter() - t])
+
+    for name, stats in result.items():
+        print(f"INFO: journal {n}: {name}: p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms")
+    return result
+
+
+def run_journal(args, workdir):
+    return {str(n): bench_journal_size(n, args, workdir) for n in args.sizes}
+
+
+# ---------- results ----------
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=""):
+    """Yield (dotted.path, value) for every numeric leaf."""
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, path + ".")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare(previous, current):
+    """Print the relative change of latency and throughput metrics between two runs."""
+    before = dict(flatten({k: previous.get(k, {}) for k in ("endpoints", "journal")}))
+    after = dict(flatten({k: current.get(k, {}) for k in ("endpoints", "journal")}))
+    print(f"\nChange vs {previous['meta'].get('git_commit') or 'previous run'}:")
+    for path, value in after.items():
+        if path not in before or not path.endswith(("p50_ms", "p95_ms", "p99_ms", "throughput_rps")):
+            continue
+        old = before[path]
+        if old:
+            change = 100 * (value - old) / old
+            worse = change < 0 if path.endswith("throughput_rps") else change > 0
+            flag = "  <-- regression" if worse and abs(change) > 10 else ""
+            print(f"  {path}: {old:.2f} -> {value:.2f} ({change:+.1f}%){flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline DreamWeaver benchmarks with a fake LLM.")
+    parser.add_argument("--suite", choices=["all", "endpoints", "journal"], default="all")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", default="lognormal:0.4:0.5",
+                        help='Fake LLM latency: "none", "fixed:S", "uniform:LO:HI" or '
+                             '"lognormal:MEDIAN:SIGMA" (seconds)')
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="Fraction of fake LLM calls failing with a retryable 503")
+    parser.add_argument("--server", choices=["flask", "asgi"], default="flask")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--prompt-pool", type=int, default=0,
+                        help="Draw prompts from this many distinct ideas (0: all unique)")
+    parser.add_argument("--no-llm-cache", action="store_true",
+                        help="Bypass the LLM response cache")
+    parser.add_argument("--endpoint-journal-size", type=int, default=1000)
+    parser.add_argument("--sizes", default="1000,100000,1000000",
+                        type=lambda s: [int(n) for n in s.split(",") if n],
+                        help="Comma-separated journal sizes for the journal suite")
+    parser.add_argument("--ops", type=int, default=100, help="Operations per journal benchmark")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    # Scratch directory for journals, indexes and the LLM cache; the fake key
+    # only satisfies app.py's startup check.
+    workdir = tempfile.mkdtemp(prefix="dreamweaver-bench-")
+    os.makedirs(os.path.join(workdir, "endpoints"))
+    os.environ.setdefault("API_KEY", "benchmark")
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ["JOURNAL_BACKEND"] = args.backend
+    default_gateway.cache = LLMCache(os.path.join(workdir, "llm_cache"), enabled=not args.no_llm_cache)
+
+    results = {
+        "meta": {
+            "started": datetime.now().isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "keep")},
+        }
+    }
+    try:
+        if args.suite in ("all", "endpoints"):
+            results["endpoints"] = run_endpoints(args, workdir)
+        if args.suite in ("all", "journal"):
+            results["journal"] = run_journal(args, workdir)
+    finally:
+        os.chdir(REPO_DIR)
+        if args.keep:
+            print(f"INFO: scratch files kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    write_json_atomic(output, results)
+    print(f"INFO: results written to {output}")
+    if previous:
+        compare(previous, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""
+Bulk import of old dreams into a journal, with batched LLM enrichment.
+
+Input is a JSON array, JSON Lines, CSV or TSV file, read as a stream.
+Records are grouped into batches, and each batch gets one LLM request that
+returns the analysis, tags and mood for every dream in it. At most
+`max_in_flight` batches are outstanding at once. Batches are written to the
+journal in input order, and the position reached is saved to a checkpoint
+after each one, so a rerun skips the work an earlier, failed run finished.
+
+    python bulk_import.py old_dreams.csv --user alice
+"""
+import csv
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from journal_store import write_json_atomic
+
+BATCH_SIZE = 20
+MAX_IN_FLIGHT = 4
+MAX_DREAM_CHARS = 2000  # per dream in the enrichment prompt
+
+FALLBACK_ANALYSIS = "Could not analyze - try again later"
+FALLBACK_TAGS = ["unprocessed"]
+FALLBACK_MOOD = "unknown"
+
+TEXT_FIELDS = ("dream", "text", "description", "content", "body")
+TIMESTAMP_FIELDS = ("timestamp", "date", "created_at", "created")
+
+
+# ---------- input ----------
+
+def iter_json_array(f, chunk_size=1 << 16):
+    """Yield the items of a top-level JSON array without reading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof, opened = "", 0, False, False
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n\ufeff" + ("," if opened else ""):
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON input")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        if not opened:
+            if buffer[pos] != "[":
+                raise ValueError("Expected a JSON array of dreams")
+            opened = True
+            pos += 1
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The item runs past the buffered text: read more and retry.
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        pos = end
+        yield item
+
+
+def detect_format(filename, content_type=None):
+    """Input format ("json", "jsonl", "csv" or "tsv") from a file name or MIME type."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext == ".csv" or content_type in ("text/csv",):
+        return "csv"
+    if ext == ".tsv" or content_type in ("text/tab-separated-values",):
+        return "tsv"
+    if ext in (".jsonl", ".ndjson") or content_type in ("application/x-ndjson", "application/jsonl"):
+        return "jsonl"
+    return "json"
+
+
+def read_raw(path, fmt):
+    if fmt in ("csv", "tsv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f, delimiter="\t" if fmt == "tsv" else ",")
+    elif fmt == "jsonl":
+        with open(path, encoding="utf-8-sig") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, encoding="utf-8") as f:
+            yield from iter_json_array(f)
+
+
+def normalize(raw):
+    """
+    Map one input record to {text, timestamp, mood, tags}; None if it has no
+    dream text or isn't a record at all.
+    """
+    if isinstance(raw, str):
+        raw = {"text": raw}
+    if not isinstance(raw, dict):
+        return None  # a number, list or null in a JSON array
+    text = next((str(raw[k]).strip() for k in TEXT_FIELDS if raw.get(k)), "")
+    if not text:
+        return None
+    tags = raw.get("tags") or []
+    if isinstance(tags, str):
+        tags = [t.strip().lower() for t in tags.replace(";", ",").split(",") if t.strip()]
+    return {
+        "text": text,
+        "timestamp": next((str(raw[k]) for k in TIMESTAMP_FIELDS if raw.get(k)), None),
+        "mood": (raw.get("mood") or "").strip().lower() or None,
+        "tags": tags,
+    }
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def store_upload(stream, directory, suffix=""):
+    """Copy an upload stream to directory/<sha256><suffix> in chunks; return (path, digest)."""
+    os.makedirs(directory, exist_ok=True)
+    h = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".upload")
+    with os.fdopen(fd, "wb") as f:
+        for block in iter(lambda: stream.read(1 << 20), b""):
+            h.update(block)
+            f.write(block)
+    digest = h.hexdigest()
+    path = os.path.join(directory, digest + suffix)
+    os.replace(tmp_path, path)
+    return path, digest
+
+
+# ---------- enrichment ----------
+
+def enrichment_prompt(texts):
+    dreams = "\n\n".join(f"Dream {i}:\n{text[:MAX_DREAM_CHARS]}" for i, text in enumerate(texts, 1))
+    return f"""Analyze each of the {len(texts)} dreams below.
+Return only a JSON array with one object per dream, in the same order, each with:
+"id": the dream number,
+"analysis": 2-3 sentences on its themes, symbols and possible meaning,
+"tags": 3-5 lowercase keywords (symbols, people, places, emotions),
+"mood": one word for its overall mood.
+
+{dreams}"""
+
+
+def parse_enrichment(text, count):
+    """Per-dream dicts from a batch response; dreams missing from it map to None."""
+    results = [None] * count
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        return results
+    try:
+        items = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return results
+    for position, item in enumerate(items if isinstance(items, list) else []):
+        if not isinstance(item, dict):
+            continue
+        index = item.get("id", position + 1)
+        if isinstance(index, int) and 1 <= index <= count:
+            results[index - 1] = item
+    return results
+
+
+# ---------- importer ----------
+
+class BulkImporter:
+    """
+    Stream records from a file into a journal, enriching them in batches.
+
+    Args:
+        journal: DreamJournalAI (or shard) the entries are written to
+        complete: Callable taking (prompt, system_msg, max_tokens) and returning text
+        batch_size: Dreams per enrichment request
+        max_in_flight: Enrichment requests outstanding at once
+    """
+
+    def __init__(self, journal, complete, batch_size=BATCH_SIZE, max_in_flight=MAX_IN_FLIGHT):
+        self.journal = journal
+        self.complete = complete
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.import_id = None
+
+    def enrich(self, batch):
+        """Journal entries for one batch of (record number, record) pairs."""
+        return self.entries(batch, parse_enrichment(
+            self.complete(enrichment_prompt([record["text"] for _, record in batch]),
+                          "You analyze dream journals and reply with JSON only.",
+                          150 * len(batch) + 100),
+            len(batch)))
+
+    def entries(self, batch, results):
+        """Journal entries from a batch and its enrichment results (None: fallback values)."""
+        entries = []
+        for (number, record), result in zip(batch, results):
+            result = result or {}
+            tags = result.get("tags")
+            entries.append({
+                "timestamp": record["timestamp"] or datetime.now().isoformat(),
+                "text": record["text"],
+                "analysis": str(result.get("analysis") or FALLBACK_ANALYSIS),
+                "tags": record["tags"] or ([str(t).lower() for t in tags][:5]
+                                           if isinstance(tags, list) and tags else FALLBACK_TAGS),
+                "mood": record["mood"] or str(result.get("mood") or FALLBACK_MOOD).lower(),
+                "import_ref": f"{self.import_id}:{number}",
+            })
+        return entries
+
+    def run(self, path, fmt=None, checkpoint_path=None, cancelled=None):
+        """
+        Import a file, resuming from its checkpoint if an earlier run stopped part-way.
+
+        Args:
+            path: JSON, JSON Lines, CSV or TSV file
+            fmt: "json", "jsonl", "csv" or "tsv" (detected from the extension if None)
+            checkpoint_path: Progress file (default: next to the input)
+            cancelled: threading.Event; once set, no further batch is written
+                (enrichment calls already in flight still finish)
+
+        Returns:
+            Dictionary with records read, entries imported and records skipped
+        """
+        fmt = fmt or detect_format(path)
+        checkpoint_path = checkpoint_path or path + ".checkpoint.json"
+        self.import_id = file_digest(path)[:16]
+        state = self._load_checkpoint(checkpoint_path)
+        # Entries written just before a crash may be missing from the checkpoint.
+        done = max(state["records_done"], self._last_committed() + 1)
+        resumed_at = done
+
+        records = itertools.islice(enumerate(read_raw(path, fmt)), done, None)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight,
+                                thread_name_prefix="import") as pool:
+            try:
+                while not (cancelled and cancelled.is_set()):
+                    chunk = list(itertools.islice(records, self.batch_size))
+                    if not chunk:
+                        break
+                    batch = []
+                    skipped = 0
+                    for number, raw in chunk:
+                        record = normalize(raw)
+                        if record is None:
+                            skipped += 1
+                        else:
+                            batch.append((number, record))
+                    last = chunk[-1][0]
+                    future = pool.submit(self.enrich, batch) if batch else None
+                    # Skips are counted when their batch commits, so they are
+                    # checkpointed together with records_done
+                    pending.append((last, batch, future, skipped))
+                    if len(pending) >= self.max_in_flight:
+                        if not self._commit(pending.popleft(), state, checkpoint_path, cancelled):
+                            break
+                while pending:
+                    if not self._commit(pending.popleft(), state, checkpoint_path, cancelled):
+                        break
+            finally:
+                for _, _, future, _ in pending:
+                    if future is not None:
+                        future.cancel()
+
+        if cancelled and cancelled.is_set():
+            print(f"INFO: import {self.import_id}: cancelled at record {state['records_done']}")
+            return {"import_id": self.import_id, "records": state["records_done"],
+                    "imported": state["imported"], "failed": state["failed"],
+                    "skipped": state["skipped"], "resumed_at": resumed_at, "cancelled": True}
+        state["complete"] = True
+        write_json_atomic(checkpoint_path, state)
+        print(f"INFO: import {self.import_id}: {state['imported']} entries imported "
+              f"({state['failed']} not enriched), {state['skipped']} skipped, "
+              f"resumed at record {resumed_at}")
+        return {"import_id": self.import_id, "records": state["records_done"],
+                "imported": state["imported"], "failed": state["failed"],
+                "skipped": state["skipped"], "resumed_at": resumed_at}
+
+    def _commit(self, item, state, checkpoint_path, cancelled=None):
+        """Write one batch and checkpoint it; False (nothing written) once cancelled."""
+        last, batch, future, skipped = item
+        entries, failed = [], 0
+        if future is not None:
+            try:
+                entries = future.result()
+            except Exception as e:
+                # Save the batch with fallback values and move past it, or
+                # every resume would retry (and fail on) the same batch
+                print(f"ERROR: import {self.import_id}: enrichment failed for records "
+                      f"{batch[0][0]}-{last}: {e}")
+                entries = self.entries(batch, [None] * len(batch))
+                failed = len(entries)
+        if cancelled and cancelled.is_set():
+            return False
+        if entries:
+            self.journal.import_entries(entries)
+            state["failed"] += failed
+            state["imported"] += len(entries)
+        state["skipped"] += skipped
+        state["records_done"] = last + 1
+        write_json_atomic(checkpoint_path, state)
+        return True
+
+    def _load_checkpoint(self, checkpoint_path):
+        try:
+            with open(checkpoint_path) as f:
+                state = json.load(f)
+            if state.get("import_id") == self.import_id:
+                state.setdefault("failed", 0)  # checkpoints from before it was counted
+                return state
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return {"import_id": self.import_id, "records_done": 0, "imported": 0, "failed": 0,
+                "skipped": 0, "complete": False}
+
+    def _last_committed(self):
+        prefix = self.import_id + ":"
+        for entry in reversed(self.journal.load_entries()):
+            ref = entry.get("import_ref", "")
+            if ref.startswith(prefix):
+                return int(ref[len(prefix):])
+        return -1
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dotenv import load_dotenv
+
+    from dream_journal import JournalShards
+    from llm_gateway import FakeProvider, GeminiProvider, GroqProvider, default_gateway
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Bulk import dreams from JSON, JSON Lines, CSV or TSV.")
+    parser.add_argument("path", help="File to import")
+    parser.add_argument("--format", choices=["json", "jsonl", "csv", "tsv"])
+    parser.add_argument("--user", help="Import into this user's journal shard")
+    parser.add_argument("--provider", choices=["gemini", "groq", "fake"], default="gemini")
+    parser.add_argument("--model", help="Model id (default depends on the provider)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT)
+    parser.add_argument("--checkpoint", help="Progress file (default: <path>.checkpoint.json)")
+    args = parser.parse_args()
+
+    if args.provider == "gemini":
+        default_gateway.register(GeminiProvider(api_key=os.getenv("API_KEY")))
+    elif args.provider == "groq":
+        default_gateway.register(GroqProvider(api_key=os.getenv("GROQ_API_KEY")))
+    else:
+        default_gateway.register(FakeProvider())
+    model = args.model or {"gemini": "gemini-2.5-flash", "groq": "llama3-70b-8192",
+                           "fake": "fake"}[args.provider]
+
+    def complete(prompt, system_msg, max_tokens):
+        return default_gateway.complete(prompt, system=system_msg, provider=args.provider,
+                                        model=model, max_tokens=max_tokens, temperature=0.3)
+
+    journal = JournalShards(os.getenv("JOURNAL_ROOT", "journals")).get(args.user)
+    importer = BulkImporter(journal, complete, args.batch_size, args.max_in_flight)
+    print(json.dumps(importer.run(args.path, args.format, args.checkpoint)))
@@ -0,0 +1,274 @@
+"""
+Near-duplicate dream detection with MinHash signatures and LSH.
+
+Each dream is reduced to its normalized words and adjacent word pairs
+(so a one-word edit touches about three of them, and "room 4" and
+"room 5" stay different dreams) and summarized by a 128-value MinHash
+signature; the share of equal values between two signatures estimates
+the Jaccard similarity of their shingle sets. The signatures are split
+into 16 bands of 8 rows, and dreams sharing any band are candidates, so a
+lookup touches a handful of entries instead of the whole journal.
+Candidates are confirmed against THRESHOLD.
+
+    python dedup.py dream_journal.json --mode link
+"""
+import os
+import re
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+NUM_PERM = 128
+BANDS = 16  # x 8 rows: pairs above ~0.7 similarity almost always share a band
+# A one-word edit of a 20-word dream scores about 0.86, of a 10-word one 0.8
+THRESHOLD = 0.85
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+_PRIME = (1 << 61) - 1
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+# Fixed seed: signatures are persisted, so the permutations must never change.
+_rng = np.random.RandomState(20240601)
+_A = _rng.randint(1, 1 << 31, NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, 1 << 31, NUM_PERM).astype(np.uint64)
+
+
+def shingles(text: str) -> set:
+    """Lowercased words and word pairs, ignoring punctuation and spacing."""
+    words = WORD_RE.findall((text or "").lower().replace("'", ""))
+    return set(words) | {first + " " + second for first, second in zip(words, words[1:])}
+
+
+def signature(text: str) -> Optional[np.ndarray]:
+    """MinHash signature (uint32[NUM_PERM]); None for text without words."""
+    grams = shingles(text)
+    if not grams:
+        return None
+    hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), np.uint64, len(grams))
+    # hash < 2^32 and a < 2^31, so a * hash + b stays below 2^64
+    values = (np.outer(hashes, _A) + _B) % np.uint64(_PRIME) & _MAX_HASH
+    return values.min(axis=0).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+def entry_text(entry: Dict) -> str:
+    # Web entries keep the dream in "text", CLI entries in "dream"
+    return entry.get("text") or entry.get("dream") or ""
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures for journal entries 0..n-1 plus the LSH band tables.
+
+    With a path, signatures are also appended to a binary side file
+    (position, text checksum, signature per record) so reopening a journal
+    only hashes entries the file doesn't cover. Not thread-safe: callers
+    serialize access (DreamJournalAI holds its _dedup_lock).
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: float = THRESHOLD,
+                 bands: int = BANDS):
+        if NUM_PERM % bands:
+            raise ValueError(f"bands must divide {NUM_PERM}")
+        self.path = path
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self._reset()
+
+    def _reset(self) -> None:
+        self.count = 0
+        self._sigs = np.zeros((1024, NUM_PERM), np.uint32)
+        self._checksums = np.zeros(1024, np.uint32)
+        self._valid = np.zeros(1024, bool)
+        self._tables = [{} for _ in range(self.bands)]
+
+    def __len__(self) -> int:
+        return self.count
+
+    # ---------- lookups ----------
+
+    def candidates(self, sig: np.ndarray) -> set:
+        found = set()
+        for band, table in enumerate(self._tables):
+            found.update(table.get(sig[band * self.rows:(band + 1) * self.rows].tobytes(), ()))
+        return found
+
+    def query(self, text: str, sig: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """(position, similarity) of indexed entries at or above the threshold, best first."""
+        sig = signature(text) if sig is None else sig
+        if sig is None:
+            return []
+        matches = []
+        for position in self.candidates(sig):
+            score = similarity(sig, self._sigs[position])
+            if score >= self.threshold:
+                matches.append((position, score))
+        matches.sort(key=lambda item: (-item[1], item[0]))
+        return matches
+
+    def best(self, text: str) -> Optional[Tuple[int, float]]:
+        """Closest near-duplicate (earliest on ties), or None."""
+        matches = self.query(text)
+        return matches[0] if matches else None
+
+    # ---------- maintenance ----------
+
+    def add(self, text: str, sig: Optional[np.ndarray] = None, persist: bool = True) -> int:
+        """Index the entry at position len(self); returns that position."""
+        position = self.count
+        sig = signature(text) if sig is None else sig
+        checksum = zlib.crc32(text.encode("utf-8"))
+        self._grow(position + 1)
+        self._checksums[position] = checksum
+        self._valid[position] = sig is not None
+        if sig is not None:
+            self._sigs[position] = sig
+            for band, table in enumerate(self._tables):
+                table.setdefault(sig[band * self.rows:(band + 1) * self.rows].tobytes(),
+                                 []).append(position)
+        self.count += 1
+        if persist and self.path:
+            self._append_records([position])
+        return position
+
+    def sync(self, texts: Sequence[str]) -> None:
+        """
+        Make the index cover exactly texts (the journal's entries, in order).
+
+        Appends are indexed incrementally; a shorter or rewritten journal
+        (detected by the last indexed entry's checksum) is re-indexed, reusing
+        persisted signatures whose checksum still matches.
+        """
+        stale = len(texts) < self.count or (
+            self.count and zlib.crc32(texts[self.count - 1].encode("utf-8"))
+            != self._checksums[self.count - 1])
+        if stale:
+            self._reset()
+        if len(texts) == self.count:
+            return
+        stored = self._read_records() if self.path else {}
+        fresh = False
+        for position in range(self.count, len(texts)):
+            text = texts[position]
+            record = stored.get(position)
+            if record is not None and record[0] == zlib.crc32(text.encode("utf-8")):
+                self.add(text, record[1] if record[2] else None, persist=False)
+            else:
+                self.add(text, persist=False)
+                fresh = True
+        if self.path and (stale or fresh):
+            self._rewrite()
+
+    def _grow(self, needed: int) -> None:
+        if needed <= len(self._checksums):
+            return
+        capacity = len(self._checksums)
+        while capacity < needed:
+            capacity *= 2
+        self._sigs = np.resize(self._sigs, (capacity, NUM_PERM))
+        self._checksums = np.resize(self._checksums, capacity)
+        self._valid = np.resize(self._valid, capacity)
+
+    # ---------- side file ----------
+
+    def _records(self, positions) -> np.ndarray:
+        positions = np.asarray(positions, np.int64)
+        records = np.empty((len(positions), NUM_PERM + 3), np.uint32)
+        records[:, 0] = positions
+        records[:, 1] = self._checksums[positions]
+        records[:, 2] = self._valid[positions]
+        records[:, 3:] = self._sigs[positions]
+        return records
+
+    def _append_records(self, positions) -> None:
+        with open(self.path, "ab") as f:
+            f.write(self._records(positions).tobytes())
+
+    def _rewrite(self) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self._records(np.arange(self.count)).tobytes())
+        os.replace(tmp_path, self.path)
+
+    def _read_records(self) -> Dict[int, Tuple[int, np.ndarray, bool]]:
+        """position -> (checksum, signature, valid); later records win."""
+        try:
+            raw = np.fromfile(self.path, dtype=np.uint32)
+        except (FileNotFoundError, ValueError):
+            return {}
+        width = NUM_PERM + 3
+        records = raw[:len(raw) // width * width].reshape(-1, width)  # drop a torn tail
+        return {int(r[0]): (int(r[1]), r[3:], bool(r[2])) for r in records}
+
+
+def find_duplicates(texts: Sequence[str], threshold: float = THRESHOLD) -> List[Dict]:
+    """
+    Batch pass: every entry that nearly duplicates an earlier one.
+
+    Returns:
+        [{"position", "duplicate_of", "similarity"}] with 0-based positions;
+        duplicate_of is always the first entry of its group
+    """
+    index = NearDuplicateIndex(threshold=threshold)
+    root = {}
+    found = []
+    for position, text in enumerate(texts):
+        sig = signature(text)
+        matches = index.query(text, sig) if sig is not None else []
+        if matches:
+            original, score = matches[0]
+            root[position] = root.get(original, original)
+            found.append({"position": position, "duplicate_of": root[position],
+                          "similarity": round(score, 3)})
+        index.add(text, sig, persist=False)
+    return found
+
+
+def dedupe(entries: List[Dict], mode: str = "drop",
+           threshold: float = THRESHOLD) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Remove ("drop") or mark ("link": duplicate_of = 1-based id of the
+    original) near-duplicate entries. Returns (entries, duplicates found).
+    """
+    duplicates = find_duplicates([entry_text(entry) for entry in entries], threshold)
+    if mode == "drop":
+        dropped = {d["position"] for d in duplicates}
+        return [entry for i, entry in enumerate(entries) if i not in dropped], duplicates
+    linked = list(entries)
+    for d in duplicates:
+        linked[d["position"]] = dict(entries[d["position"]], duplicate_of=d["duplicate_of"] + 1)
+    return linked, duplicates
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from dream_journal import DreamJournalAI
+    from journal_store import write_json_atomic
+
+    parser = argparse.ArgumentParser(description="Find and remove near-duplicate dreams in a journal.")
+    parser.add_argument("path", nargs="?", default="dream_journal.json")
+    parser.add_argument("--backend", choices=["json", "sqlite"])
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--mode", choices=["drop", "link"], default="drop",
+                        help="Drop duplicates, or keep them with duplicate_of set")
+    parser.add_argument("--output", help="Deduplicated journal (default: <path>.deduped.json)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report duplicates")
+    args = parser.parse_args()
+
+    entries = DreamJournalAI(args.path, args.backend).load_entries()
+    result, duplicates = dedupe(entries, args.mode, args.threshold)
+    for d in duplicates:
+        print(f"entry {d['position'] + 1} ~ entry {d['duplicate_of'] + 1} "
+              f"(similarity {d['similarity']:.2f})")
+    if not args.dry_run:
+        output = args.output or os.path.splitext(args.path)[0] + ".deduped.json"
+        write_json_atomic(output, result)
+        print(f"INFO: wrote {len(result)} entries to {output}")
+    print(json.dumps({"entries": len(entries), "duplicates": len(duplicates)}))
@@ -0,0 +1,252 @@
+import math
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from vector_index import CONCEPT_STEMS, TOKEN_RE, _stem
+
+# Mood cue words, matched by stem; the labels are main.py's mood list.
+# "neutral" has no cues: it wins when nothing else has evidence, and "other"
+# is left to the LLM.
+MOOD_LEXICON = {
+    "happy": ["happy", "joy", "joyful", "laugh", "smile", "love", "warm", "peace", "peaceful",
+              "calm", "beautiful", "wonderful", "delight", "glad", "cheerful", "celebrate", "hug",
+              "bright", "relief", "comfort", "safe", "fun", "playing", "sunshine", "content"],
+    "anxious": ["anxious", "anxiety", "worry", "worried", "nervous", "late", "exam", "test",
+                "unprepared", "stress", "stressed", "panic", "rush", "hurry", "forget", "forgot",
+                "missing", "naked", "embarrassed", "pressure", "deadline", "tense", "uneasy",
+                "restless", "failing"],
+    "fearful": ["fear", "afraid", "scared", "terrified", "terror", "horror", "monster", "chase",
+                "chased", "scream", "screaming", "kill", "attack", "blood", "ghost", "demon",
+                "trapped", "danger", "threat", "nightmare", "evil", "creepy", "hunted", "knife",
+                "intruder"],
+    "exciting": ["exciting", "excited", "thrill", "thrilling", "adventure", "fly", "flying",
+                 "soar", "race", "explore", "discover", "amazing", "magic", "superpower",
+                 "treasure", "journey", "adrenaline", "epic", "victory", "won", "rocket",
+                 "powerful"],
+    "sad": ["sad", "cry", "crying", "cried", "tears", "grief", "loss", "lonely", "alone", "miss",
+            "funeral", "goodbye", "regret", "sorrow", "heartbroken", "empty", "depressed",
+            "mourn", "abandoned", "rejected", "gone", "died"],
+    "confusing": ["confused", "confusing", "strange", "weird", "bizarre", "odd", "surreal",
+                  "morph", "transform", "maze", "impossible", "nonsense", "unclear", "blur",
+                  "blurry", "unfamiliar", "puzzle", "shifting", "changed", "disoriented"],
+    "neutral": [],
+}
+
+NEGATIONS = {"not", "no", "never", "without", "nothing", "wasnt", "didnt", "dont", "isnt"}
+
+STOPWORDS = set("""
+a about above after again against all almost also am an and any are around as at away back
+be because been before being below between both but by came can come could did do does doing
+down during each even ever every few for from further get got had has have having he her here
+hers herself him himself his how i if in into is it its itself just like made make me more most
+my myself no nor not now of off on once one only or other our ours ourselves out over own really
+said same saw see seemed she should so some still such suddenly than that the their theirs them
+themselves then there these they thing things this those through to too took under until up
+upon us very was we went were what when where which while who whom why will with would you your
+yours yourself yourselves dream dreamed dreamt dreaming dreams remember felt feel feeling
+something someone somewhere started kept knew know think thought looked look going
+many much another lot lots way let put
+""".split())
+
+MIN_TAG_LENGTH = 3
+
+
+def _tokens(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower().replace("'", ""))
+
+
+class DreamClassifier:
+    """
+    Local mood classifier and tag extractor for dream descriptions.
+
+    Mood is scored against a cue lexicon (negated cues such as "not scared"
+    are skipped) and turned into probabilities with a softmax, so every label
+    comes with a confidence; callers fall back to the LLM when it is low.
+    Tags are the most frequent non-stopword stems, weighted by rarity across
+    the corpus when document frequencies are known.
+    """
+
+    def __init__(self, lexicon: Dict[str, List[str]] = MOOD_LEXICON, neutral_prior: float = 1.0,
+                 sharpness: float = 1.5):
+        """
+        Args:
+            lexicon: Mood -> cue words
+            neutral_prior: Score "neutral" gets without any cues
+            sharpness: Softmax scale; higher makes a few cues more decisive
+        """
+        self.moods = list(lexicon)
+        self.neutral = self.moods.index("neutral")
+        self.neutral_prior = neutral_prior
+        self.sharpness = sharpness
+        self.cues = {}  # stem -> row in self.weights
+        rows = []
+        for mood_index, (mood, words) in enumerate(lexicon.items()):
+            for word in words:
+                stem = _stem(word)
+                if stem not in self.cues:
+                    self.cues[stem] = len(rows)
+                    rows.append(np.zeros(len(self.moods), dtype=np.float32))
+                rows[self.cues[stem]][mood_index] = 1.0
+        self.weights = np.vstack(rows) if rows else np.zeros((0, len(self.moods)), np.float32)
+        self.doc_freq = Counter()
+        self.n_docs = 0
+
+    # ---------- mood ----------
+
+    def _cue_ids(self, text: str) -> List[int]:
+        ids = []
+        tokens = _tokens(text)
+        for position, token in enumerate(tokens):
+            row = self.cues.get(_stem(token))
+            if row is not None and not NEGATIONS.intersection(tokens[max(0, position - 2):position]):
+                ids.append(row)
+        return ids
+
+    def mood_scores(self, texts: Sequence[str]) -> np.ndarray:
+        """(len(texts), len(moods)) matrix of mood probabilities."""
+        doc_ids, cue_ids = [], []
+        for doc, text in enumerate(texts):
+            ids = self._cue_ids(text)
+            cue_ids.extend(ids)
+            doc_ids.extend([doc] * len(ids))
+        scores = np.zeros((len(texts), len(self.moods)), dtype=np.float32)
+        if cue_ids:
+            np.add.at(scores, np.asarray(doc_ids), self.weights[np.asarray(cue_ids)])
+        scores[:, self.neutral] += self.neutral_prior
+        scores *= self.sharpness
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        scores /= scores.sum(axis=1, keepdims=True)
+        return scores
+
+    def moods_for(self, texts: Sequence[str]) -> List[Tuple[str, float]]:
+        """(mood, confidence) for each text, scored in one vectorized pass."""
+        if not texts:
+            return []
+        probs = self.mood_scores(texts)
+        best = probs.argmax(axis=1)
+        return [(self.moods[m], float(probs[i, m])) for i, m in enumerate(best)]
+
+    def mood(self, text: str) -> Tuple[str, float]:
+        return self.moods_for([text])[0]
+
+    # ---------- tags ----------
+
+    def fit(self, texts: Iterable[str]) -> "DreamClassifier":
+        """Learn document frequencies so tags favour words that are rare in the journal."""
+        for text in texts:
+            self.doc_freq.update({_stem(t) for t in _tokens(text)})
+            self.n_docs += 1
+        return self
+
+    def tags(self, text: str, k: int = 5) -> Tuple[List[str], float]:
+        """
+        Return up to k tags and a confidence in [0, 1].
+
+        Confidence is the share of the (up to 3) leading tags backed by
+        repetition or a known dream theme; single mentions of ordinary words
+        are weak evidence.
+        """
+        counts = Counter()
+        surfaces = {}
+        first_seen = {}
+        for position, token in enumerate(_tokens(text)):
+            if len(token) < MIN_TAG_LENGTH or token in STOPWORDS:
+                continue
+            stem = _stem(token)
+            counts[stem] += 1
+            surfaces.setdefault(stem, Counter())[token] += 1
+            first_seen.setdefault(stem, position)
+        if not counts:
+            return [], 0.0
+
+        def weight(stem):
+            idf = 1.0
+            if self.n_docs:
+                idf = math.log((self.n_docs + 1) / (self.doc_freq.get(stem, 0) + 1)) + 1.0
+            return (counts[stem] + (1.0 if stem in CONCEPT_STEMS else 0.0)) * idf
+
+        ranked = sorted(counts, key=lambda stem: (-weight(stem), first_seen[stem]))[:k]
+        # Most common spelling of each stem; ties go to the first one written.
+        tags = [max(surfaces[stem].items(), key=lambda item: item[1])[0] for stem in ranked]
+        strong = sum(1 for stem in ranked[:3] if counts[stem] > 1 or stem in CONCEPT_STEMS)
+        return tags, strong / 3
+
+    def tags_for(self, texts: Sequence[str], k: int = 5) -> List[Tuple[List[str], float]]:
+        """Tags for a whole corpus, with document frequencies taken from that corpus."""
+        if not self.n_docs:
+            self.fit(texts)
+        return [self.tags(text, k) for text in texts]
+
+    # ---------- backfill ----------
+
+    def backfill(self, entries: List[Dict], min_confidence: float = 0.0,
+                 overwrite: bool = False) -> int:
+        """
+        Fill in missing or placeholder moods and tags in place.
+
+        Args:
+            entries: Journal entries ('dream' or 'text' holds the description)
+            min_confidence: Leave a mood alone if the local guess is below this
+                (any local tags beat the "unprocessed" placeholder)
+            overwrite: Replace existing values too
+
+        Returns:
+            Number of entries changed
+        """
+        texts = [entry.get('dream') or entry.get('text') or '' for entry in entries]
+        moods = self.moods_for(texts)
+        tags = self.tags_for(texts)
+        changed = 0
+        for entry, (mood, mood_conf), (tag_list, _) in zip(entries, moods, tags):
+            updated = False
+            if (overwrite or entry.get('mood') in (None, "", "unknown")) and mood_conf >= min_confidence:
+                entry['mood'] = mood
+                updated = True
+            if (overwrite or entry.get('tags') in (None, [], ["unprocessed"])) and tag_list:
+                entry['tags'] = tag_list
+                updated = True
+            changed += updated
+        return changed
+
+
+default_classifier = DreamClassifier()
+
+
+def extract_tags(text: str, k: int = 5) -> List[str]:
+    """Deterministic local tags for one dream."""
+    return default_classifier.tags(text, k)[0]
+
+
+def classify_mood(text: str) -> Tuple[str, float]:
+    """Local (mood, confidence) for one dream."""
+    return default_classifier.mood(text)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from journal_store import open_store
+
+    parser = argparse.ArgumentParser(
+        description="Backfill missing moods and tags in a journal in one local pass.")
+    parser.add_argument("path", nargs="?", default="dream_journal.json")
+    parser.add_argument("--backend", choices=["json", "sqlite"])
+    parser.add_argument("--min-confidence", type=float, default=0.6)
+    parser.add_argument("--overwrite", action="store_true", help="Relabel every entry")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    store = open_store(args.path, args.backend)
+    classifier = DreamClassifier()
+    if args.dry_run:
+        entries = store.load()
+        changed = classifier.backfill(entries, args.min_confidence, args.overwrite)
+    else:
+        # Under the store's write lock, so saves made meanwhile (including
+        # ones still in the append-only log) are neither missed nor lost
+        entries, changed = store.rewrite(lambda entries: (
+            entries, classifier.backfill(entries, args.min_confidence, args.overwrite)))
+    print(f"{changed} of {len(entries)} entries {'would be ' if args.dry_run else ''}updated")
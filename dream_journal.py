@@ -1,39 +1,312 @@
+import hashlib
 import json
 import os
+import re
+import threading
+from collections import OrderedDict
 from datetime import datetime
 
+import http_cache
+import metrics
+from journal_store import JsonLogStore, open_store, paginate_entries, write_json_atomic
+
+# What save_entry does with a near-duplicate of an existing dream: "link"
+# saves it with duplicate_of set and the original's analysis and tags,
+# "merge" returns the existing entry (merged=True) without saving, "off"
+# doesn't check.
+DEDUP_MODE = os.getenv("DEDUP_MODE", "link")
+
+
+def dedup_index_path(filepath):
+    """MinHash side file for a journal, shared by the web app and the CLI."""
+    return os.path.splitext(filepath)[0] + ".minhash"
+
+
 class DreamJournalAI:
-    def __init__(self):
-        self.filepath = "dream_journal.json"
-        if not os.path.exists(self.filepath):
-            with open(self.filepath, "w") as f:
-                json.dump([], f)
+    def __init__(self, filepath="dream_journal.json", backend=None, dedup=None):
+        # backend is "json" (snapshot + append-only log) or "sqlite";
+        # defaults to $JOURNAL_BACKEND, falling back to json.
+        self.filepath = filepath
+        self.backend = backend
+        self.dedup = dedup or DEDUP_MODE
+        self._store = None  # opened on first use
+        self._store_lock = threading.Lock()
+
+        # Read cache: parsed entries and their serialized JSON, keyed on the
+        # store's stat fingerprint plus a counter bumped by our own writes.
+        self._cache_lock = threading.Lock()
+        self._cache_key = None
+        self._cached_entries = None
+        self._cached_json = None
+        self._variants = {}  # (fields, encoding) -> projected/compressed JSON bytes
+        self._write_version = 0
+        self._cache_hits = 0
+        self._cache_misses = 0
+        # Columnar analytics snapshot and the cached entry list it was built from
+        self._analytics = (None, None)
+        # MinHash/LSH index of entry texts (built on first save), and the
+        # store's read_since() cursor for the entries it covers
+        self._dedup_lock = threading.Lock()
+        self._dedup_index = None
+        self._dedup_cursor = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._store_lock:
+                if self._store is None:
+                    self._store = open_store(self.filepath, self.backend)
+        return self._store
 
     def analyze_dream(self, text):
         # Very basic placeholder analysis
         return "This dream shows your inner thoughts and emotions."
 
     def extract_tags(self, text):
-        words = text.split()
-        tags = [w.strip('.,!?').lower() for w in words if len(w) > 4]
-        return list(set(tags))[:5]
+        # Frequency-ranked, stopword-aware and deterministic
+        from dream_classifier import extract_tags  # deferred: keeps numpy out of startup
+
+        return extract_tags(text)
 
     def save_entry(self, text, mood):
-        entry = {
+        if self.dedup == "off":
+            return self._append(self._new_entry(text, mood))
+        with self._dedup_lock:
+            index = self._synced_dedup_index()
+            match = index.best(text)
+            original = self.load_entries()[match[0]] if match else None
+            if original is not None and self.dedup == "merge":
+                # Resubmitted dream: the journal (and its statistics) stay as they are
+                return dict(original, id=match[0] + 1, duplicate_of=match[0] + 1, merged=True)
+            entry = self._new_entry(text, mood, original)
+            if original is not None:
+                entry["duplicate_of"] = match[0] + 1
+            self._append(entry)
+        return entry
+
+    def find_duplicate(self, text):
+        """(id, entry, similarity) of the closest near-duplicate of text, or None."""
+        with self._dedup_lock:
+            match = self._synced_dedup_index().best(text)
+        if match is None:
+            return None
+        return match[0] + 1, self.load_entries()[match[0]], match[1]
+
+    def _new_entry(self, text, mood, original=None):
+        if original is None:
+            analysis, tags = self.analyze_dream(text), self.extract_tags(text)
+        else:
+            # A linked duplicate reuses the original's enrichment
+            analysis, tags = original.get("analysis", ""), original.get("tags", [])
+        return {
             "timestamp": datetime.now().isoformat(),
             "text": text,
-            "analysis": self.analyze_dream(text),
-            "tags": self.extract_tags(text),
+            "analysis": analysis,
+            "tags": tags,
             "mood": mood
         }
-        entries = self.load_entries()
-        entries.append(entry)
-        with open(self.filepath, "w") as f:
-            json.dump(entries, f, indent=2)
+
+    def _append(self, entry):
+        with metrics.JOURNAL_SECONDS.time("append", stage="journal_write"):
+            self.store.append(entry)
+        self._invalidate()
+        return entry
+
+    def _synced_dedup_index(self):
+        # Caller holds _dedup_lock. Entries are indexed as the store reports
+        # them, our own saves included, so positions follow the journal's
+        # order even when another process appends between two of our saves.
+        # Only the log tail is read, except after a compaction or rewrite.
+        from dedup import NearDuplicateIndex, entry_text
+
+        if self._dedup_index is None:
+            self._dedup_index = NearDuplicateIndex(dedup_index_path(self.filepath))
+        start, entries, self._dedup_cursor = self.store.read_since(self._dedup_cursor)
+        texts = [entry_text(entry) for entry in entries]
+        if start:
+            for text in texts:
+                self._dedup_index.add(text)
+        else:
+            self._dedup_index.sync(texts)
+        return self._dedup_index
 
     def load_entries(self):
-        try:
-            with open(self.filepath) as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            return []
+        """Return all entries; the list is shared with the cache, don't mutate it."""
+        return self._cached()[0]
+
+    def entries_json(self, fields=None, encoding=None):
+        """
+        Return all entries as pre-serialized JSON bytes, optionally projected
+        to some fields and compressed ("gzip" or "br"). Every variant is
+        cached until the journal changes.
+        """
+        entries, body = self._cached()
+        if body is None:
+            with metrics.JOURNAL_SECONDS.time("serialize", stage="journal_read"):
+                body = json.dumps(entries, separators=(",", ":")).encode("utf-8")
+            with self._cache_lock:
+                if self._cached_entries is entries:
+                    self._cached_json = body
+        if not fields and not encoding:
+            return body
+        variant = (fields, encoding)
+        with self._cache_lock:
+            cached = self._variants.get(variant) if self._cached_entries is entries else None
+        if cached is not None:
+            return cached
+        with metrics.JOURNAL_SECONDS.time("serialize", stage="journal_read"):
+            if fields:
+                body = http_cache.json_bytes(http_cache.project(entries, fields))
+            if encoding:
+                body = http_cache.compress(body, encoding)
+        with self._cache_lock:
+            if self._cached_entries is entries:
+                if len(self._variants) >= 16:
+                    self._variants.clear()
+                self._variants[variant] = body
+        return body
+
+    def version(self):
+        """
+        Opaque journal version for ETags: changes on every write, from any
+        process, without reading the entries.
+        """
+        return http_cache.make_etag(self.filepath, self.store.version_key())
+
+    def query_entries(self, limit=None, after=None, mood=None, tag=None, since=None, until=None,
+                      before=None, newest_first=False):
+        """Return (entries, next_cursor) for one page of filtered entries."""
+        if isinstance(self.store, JsonLogStore):
+            # The JSON store scans anyway, so scan the cached copy.
+            entries = self.load_entries()
+            with metrics.JOURNAL_SECONDS.time("query", stage="journal_read"):
+                return paginate_entries(entries, limit, after, mood, tag, since, until,
+                                        before, newest_first)
+        with metrics.JOURNAL_SECONDS.time("query", stage="journal_read"):
+            return self.store.query(limit=limit, after=after, mood=mood, tag=tag,
+                                    since=since, until=until, before=before,
+                                    newest_first=newest_first)
+
+    def analytics(self):
+        """Columnar snapshot with rollups, rebuilt only when the journal has changed."""
+        entries = self.load_entries()
+        source, snapshot = self._analytics
+        if source is not entries:
+            from journal_analytics import JournalAnalytics
+
+            with metrics.JOURNAL_SECONDS.time("analytics_build", stage="journal_read"):
+                snapshot = JournalAnalytics(entries)
+            self._analytics = (entries, snapshot)
+        return snapshot
+
+    def cache_stats(self):
+        total = self._cache_hits + self._cache_misses
+        return {
+            "hits": self._cache_hits,
+            "misses": self._cache_misses,
+            "hit_ratio": self._cache_hits / total if total else 0.0,
+        }
+
+    def compact(self):
+        self.store.compact()
+        self._invalidate()
+
+    def export_json(self, path):
+        write_json_atomic(path, self.load_entries())
+
+    def import_json(self, path):
+        with open(path) as f:
+            entries = json.load(f)
+        return self.import_entries(entries)
+
+    def import_entries(self, entries):
+        # One write (and one fsync) for the whole batch
+        with metrics.JOURNAL_SECONDS.time("import", stage="journal_write"):
+            self.store.import_entries(entries)
+        self._invalidate()
+        return len(entries)
+
+    # ---------- read cache ----------
+
+    def _invalidate(self):
+        with self._cache_lock:
+            self._write_version += 1
+            self._cached_entries = None
+            self._cached_json = None
+            self._variants = {}
+
+    def _cached(self):
+        # Take the fingerprint before reading, so a write that lands
+        # mid-read shows up as a changed key on the next call.
+        key = (self._write_version, self.store.version_key())
+        with self._cache_lock:
+            if self._cached_entries is not None and key == self._cache_key:
+                self._cache_hits += 1
+                return self._cached_entries, self._cached_json
+            self._cache_misses += 1
+        with metrics.JOURNAL_SECONDS.time("load", stage="journal_read"):
+            entries = self.store.load()
+        with self._cache_lock:
+            if key[0] == self._write_version:
+                self._cache_key = key
+                self._cached_entries = entries
+                self._cached_json = None
+                self._variants = {}
+        return entries, None
+
+
+class JournalShards:
+    # One DreamJournalAI per user, each with its own files under
+    # root/<2-char hash prefix>/<user id>.json, so writes for different users
+    # never share a lock or a file. Requests without a user id get the
+    # legacy single journal.
+    USER_ID = re.compile(r"^[A-Za-z0-9_.@-]{1,64}$")
+
+    def __init__(self, root="journals", backend=None, default=None, max_open=1024):
+        self.root = root
+        self.backend = backend
+        self.default = default or DreamJournalAI(backend=backend)
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._open = OrderedDict()  # user id -> DreamJournalAI, least recently used first
+
+    def path_for(self, user_id):
+        prefix = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:2]
+        return os.path.join(self.root, prefix, user_id + ".json")
+
+    def get(self, user_id=None):
+        """Return the journal for user_id (the shared legacy journal if None)."""
+        if not user_id:
+            return self.default
+        if not self.USER_ID.match(user_id) or user_id.strip(".") == "":
+            raise ValueError(f"Invalid user id: {user_id!r}")
+        with self._lock:
+            journal = self._open.get(user_id)
+            if journal is None:
+                # Opening is a one-off per user; doing it under the lock keeps
+                # two threads from initializing the same files at once.
+                path = self.path_for(user_id)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                journal = self._open[user_id] = DreamJournalAI(path, self.backend)
+                while len(self._open) > self.max_open:
+                    # Closed shards just reopen from disk; the file locks keep
+                    # a straggling writer on an evicted instance safe.
+                    self._open.popitem(last=False)
+            else:
+                self._open.move_to_end(user_id)
+            return journal
+
+    def cache_stats(self):
+        with self._lock:
+            journals = [self.default, *self._open.values()]
+        hits = misses = 0
+        for journal in journals:
+            stats = journal.cache_stats()
+            hits += stats["hits"]
+            misses += stats["misses"]
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            "open_shards": len(journals) - 1,
+        }
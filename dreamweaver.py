@@ -1,46 +1,104 @@
 # dreamweaver.py
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import streamlit as st
-from openai import OpenAI
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from llm_gateway import OpenAIProvider, default_gateway
+
+# DALL·E image URLs expire after about an hour
+IMAGE_TTL = 3600
+
+
+# Streamlit reruns this script on every interaction; the gateway (and the
+# OpenAI client inside it) is built once per process and shared by sessions
+@st.cache_resource
+def get_gateway():
+    if not default_gateway.has_provider("openai"):
+        default_gateway.register(OpenAIProvider(api_key=st.secrets["OPENAI_API_KEY"]))
+    return default_gateway
+
+
+gateway = get_gateway()
+client = gateway.provider("openai").client
+
+
+# Story and image are memoized per dream text across sessions, so a rerun (or
+# another user weaving the same dream) doesn't pay for the calls again
+@st.cache_data(show_spinner=False, max_entries=1000)
+def weave_story(dream):
+    # 1️⃣ Generate Story using GPT-3.5-turbo (cheaper)
+    return gateway.complete(
+        f"Write a short story about this dream: {dream}",
+        system="You are a creative storyteller.",
+        provider="openai",
+        model="gpt-3.5-turbo"
+    )
 
-# Initialize OpenAI client with your secret key
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+
+@st.cache_data(show_spinner=False, max_entries=1000, ttl=IMAGE_TTL)
+def weave_image(dream):
+    # 2️⃣ Generate Meme (Image) — keep same DALL·E
+    response_image = client.images.generate(
+        model="dall-e-3",
+        prompt=f"Create a fun, colorful meme image for this dream: {dream}",
+        n=1,
+        size="512x512"
+    )
+    return response_image.data[0].url
+
+
+def show_story(slot, story):
+    with slot.container():
+        st.subheader("✨ Your Dream Story:")
+        st.write(story)
+
+
+def show_image(slot, image_url):
+    with slot.container():
+        st.subheader("🖼️ Your Dream Meme:")
+        st.image(image_url, caption="AI-generated Meme")
+
+
+RENDERERS = {"story": show_story, "image_url": show_image}
 
 # Streamlit UI
 st.title("🌙 Dream Weaver AI")
 st.write("Turn your dreams into stories and memes! AI magic, low cost!")
 
+# Results of this session's weaves, by dream text; they stay on screen across reruns
+if "weaves" not in st.session_state:
+    st.session_state.weaves = {}
+
 # User input
-dream = st.text_input("💭 Describe your dream in one line:")
+dream = st.text_input("💭 Describe your dream in one line:").strip()
+slots = {"story": st.empty(), "image_url": st.empty()}
 
 if st.button("✨ Weave My Dream"):
     if dream:
-        try:
-            # 1️⃣ Generate Story using GPT-3.5-turbo (cheaper)
-            response_story = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a creative storyteller."},
-                    {"role": "user", "content": f"Write a short story about this dream: {dream}"}
-                ]
-            )
-            story = response_story.choices[0].message.content
-            st.subheader("✨ Your Dream Story:")
-            st.write(story)
-
-            # 2️⃣ Generate Meme (Image) — keep same DALL·E
-            response_image = client.images.generate(
-                model="dall-e-3",
-                prompt=f"Create a fun, colorful meme image for this dream: {dream}",
-                n=1,
-                size="512x512"
-            )
-            image_url = response_image.data[0].url
-            st.subheader("🖼️ Your Dream Meme:")
-            st.image(image_url, caption="AI-generated Meme")
-
-        except Exception as e:
-            st.error(f"Oops! Something went wrong: {e}")
+        results = st.session_state.weaves.setdefault(dream, {})
+        missing = {"story": weave_story, "image_url": weave_image}
+        for key in results:
+            missing.pop(key, None)
+            RENDERERS[key](slots[key], results[key])
+        if missing:
+            # Story and image run side by side; each is shown as soon as it lands
+            ctx = get_script_run_ctx()
+            with ThreadPoolExecutor(max_workers=len(missing), initializer=add_script_run_ctx,
+                                    initargs=(None, ctx)) as pool:
+                futures = {pool.submit(fn, dream): key for key, fn in missing.items()}
+                for key in missing:
+                    slots[key].info("⏳ Weaving...")
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        results[key] = future.result()
+                        RENDERERS[key](slots[key], results[key])
+                    except Exception as e:
+                        slots[key].error(f"Oops! Something went wrong: {e}")
 
     else:
         st.warning("Please enter a dream first!")
+elif dream in st.session_state.weaves:
+    for key, value in st.session_state.weaves[dream].items():
+        RENDERERS[key](slots[key], value)
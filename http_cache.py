@@ -0,0 +1,117 @@
+import gzip
+import hashlib
+import json
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Bodies worth compressing; smaller ones gain less than the header costs
+COMPRESSIBLE_TYPES = {"application/json", "text/html", "text/plain", "text/css",
+                      "application/javascript", "image/svg+xml"}
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Journal responses may be stored but must be revalidated (a cheap 304) before reuse
+REVALIDATE = "private, no-cache"
+
+
+def negotiate_encoding(accept_encoding):
+    """Best supported encoding ("br", "gzip" or None) for an Accept-Encoding header."""
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output (and so the ETag's meaning) byte-for-byte stable
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+
+def make_etag(*parts):
+    """Strong validator for a representation described by parts (unquoted)."""
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:24]
+
+
+def encoded_etag(etag, encoding):
+    """Each content coding is a distinct representation, so it gets its own strong ETag."""
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Whether an If-None-Match header matches etag (weak comparison, as the
+    header requires), in any of its encoded variants.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    variants = {etag, f"{etag}-gzip", f"{etag}-br"}
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') in variants:
+            return True
+    return False
+
+
+def parse_fields(value):
+    """?fields=a,b -> ("a", "b"); None when absent (all fields)."""
+    fields = tuple(dict.fromkeys(f.strip() for f in (value or "").split(",") if f.strip()))
+    return fields or None
+
+
+def project(entries, fields):
+    """Keep only the requested fields (and the cursor id) of each entry."""
+    if not fields:
+        return entries
+    keep = fields if "id" in fields else fields + ("id",)
+    return [{key: entry[key] for key in keep if key in entry} for entry in entries]
+
+
+def json_bytes(value):
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def should_compress(response, streamed):
+    """Whether an outgoing response is an uncompressed, compressible full body."""
+    return (not streamed and response.status_code == 200
+            and response.mimetype in COMPRESSIBLE_TYPES
+            and "Content-Encoding" not in response.headers)
+
+
+def apply_encoding(response, body, encoding):
+    """Swap in a compressed body and mark the response (and its ETag) accordingly."""
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    etag = response.headers.get("ETag", "")
+    if etag.startswith('"'):
+        value = encoded_etag(etag.strip('"'), encoding)
+        response.headers["ETag"] = f'"{value}"'
+
+
+def add_vary(response):
+    vary = response.headers.get("Vary", "")
+    if "accept-encoding" not in vary.lower():
+        response.headers["Vary"] = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
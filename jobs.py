@@ -0,0 +1,189 @@
+import itertools
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+# Job states; the last four are terminal
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+FINISHED = {SUCCEEDED, FAILED, CANCELLED, TIMED_OUT}
+
+
+class QueueFull(Exception):
+    """The job queue is at capacity."""
+
+
+class Job:
+    def __init__(self, fn, kind, priority, timeout):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.kind = kind
+        self.priority = priority
+        self.timeout = timeout
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        # Set when the job is cancelled or times out; fn polls it to stop early
+        self.cancelled = threading.Event()
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "type": self.kind,
+            "status": self.status,
+            "priority": self.priority,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.status == SUCCEEDED:
+            data["result"] = self.result
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class JobQueue:
+    """
+    Bounded worker pool fed by a priority queue (lower number runs first).
+
+    Jobs time out `timeout` seconds after they are submitted, whether still
+    queued or running. A job function is called as fn(cancelled) with a
+    threading.Event that is set when the job is cancelled or times out; a
+    call already in progress runs to completion unless fn checks it, and
+    its late result is discarded. Finished jobs are kept for `result_ttl`
+    seconds so clients can poll for them.
+    """
+
+    def __init__(self, workers=4, max_queue=100, result_ttl=600, default_timeout=120):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.default_timeout = default_timeout
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._jobs = {}
+        # Queued and running jobs, checked for deadlines on submit and stats();
+        # cancelled and timed-out jobs stay in _queue until a worker skips them
+        self._active = {}
+        self._expiry = deque()  # (finished time, job id), oldest first
+        self._threads = []
+        self._waits = deque(maxlen=1000)  # recent queue wait times (seconds)
+        self.running = 0
+        self.completed = 0
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"job-worker-{len(self._threads)}",
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, fn, kind, priority=5, timeout=None):
+        """Queue fn(cancelled) to run on the worker pool and return its Job."""
+        job = Job(fn, kind, priority, timeout or self.default_timeout)
+        with self._lock:
+            self._purge()
+            if self._queued() >= self.max_queue:
+                raise QueueFull(f"Job queue is full ({self.max_queue} waiting)")
+            self._jobs[job.id] = job
+            self._active[job.id] = job
+            self._start_workers()
+        self._queue.put((priority, next(self._counter), job))
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge()
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._check_deadline(job)
+            return job
+
+    def cancel(self, job_id):
+        """Cancel a job that hasn't finished; a running job's result is discarded."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return False
+            self._finish(job, CANCELLED)
+            return True
+
+    def stats(self):
+        with self._lock:
+            queued = self._queued()
+            waits = sorted(self._waits)
+        return {
+            "workers": self.workers,
+            "queue_depth": queued,
+            "running": self.running,
+            "completed": self.completed,
+            "wait_avg_ms": 1000 * sum(waits) / len(waits) if waits else 0.0,
+            "wait_p95_ms": 1000 * waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+            "wait_max_ms": 1000 * waits[-1] if waits else 0.0,
+        }
+
+    # ---------- internals (callers hold self._lock) ----------
+
+    def _finish(self, job, status, result=None, error=None):
+        if status in (CANCELLED, TIMED_OUT):
+            job.cancelled.set()
+        self._active.pop(job.id, None)
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished = time.time()
+        job.fn = None
+        self.completed += 1
+        self._expiry.append((job.finished, job.id))
+
+    def _check_deadline(self, job):
+        if job.status in (QUEUED, RUNNING) and time.time() - job.created > job.timeout:
+            self._finish(job, TIMED_OUT, error=f"Timed out after {job.timeout:g}s")
+
+    def _queued(self):
+        # Expire overdue jobs first, so a queue of timed-out jobs isn't "full"
+        for job in list(self._active.values()):
+            self._check_deadline(job)
+        return sum(1 for job in self._active.values() if job.status == QUEUED)
+
+    def _purge(self):
+        cutoff = time.time() - self.result_ttl
+        while self._expiry and self._expiry[0][0] < cutoff:
+            _, job_id = self._expiry.popleft()
+            self._jobs.pop(job_id, None)
+
+    def _work(self):
+        while True:
+            _, _, job = self._queue.get()
+            with self._lock:
+                self._check_deadline(job)
+                if job.status != QUEUED:
+                    continue
+                job.status = RUNNING
+                job.started = time.time()
+                self._waits.append(job.started - job.created)
+                self.running += 1
+                fn = job.fn
+            try:
+                result, error = fn(job.cancelled), None
+            except Exception as e:
+                result, error = None, str(e)
+            with self._lock:
+                self.running -= 1
+                self._check_deadline(job)
+                if job.status == RUNNING:
+                    if error is None:
+                        self._finish(job, SUCCEEDED, result=result)
+                    else:
+                        self._finish(job, FAILED, error=error)
@@ -0,0 +1,275 @@
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+GRANULARITIES = ("day", "week", "month")
+_UNIX_EPOCH = date(1970, 1, 1).toordinal()
+
+
+class _Vocab:
+    """Interns strings (moods, tags, models) as small integer ids."""
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def id(self, name):
+        index = self.ids.get(name)
+        if index is None:
+            index = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+
+def _parse_day(value: Optional[str]) -> Optional[int]:
+    """Proleptic ordinal of an ISO date/timestamp (day resolution); ValueError if malformed."""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value[:10]).toordinal()
+    except ValueError:
+        raise ValueError(f"Invalid date: {value!r} (expected YYYY-MM-DD)") from None
+
+
+def _bucket_keys(days: np.ndarray, granularity: str) -> np.ndarray:
+    """Bucket number of each day ordinal; weeks start on Monday, months count from 1970-01."""
+    if granularity == "day":
+        return days.astype(np.int64)
+    if granularity == "week":
+        return (days.astype(np.int64) - 1) // 7  # date.fromordinal(1) is a Monday
+    return (days.astype(np.int64) - _UNIX_EPOCH).astype("datetime64[D]") \
+        .astype("datetime64[M]").astype(np.int64)
+
+
+def _bucket_start(key: int, granularity: str) -> int:
+    """First day ordinal of a bucket."""
+    if granularity == "day":
+        return key
+    if granularity == "week":
+        return key * 7 + 1
+    year, month = divmod(key, 12)
+    return date(1970 + year, month + 1, 1).toordinal()
+
+
+def _bucket_label(key: int, granularity: str) -> str:
+    if granularity == "month":
+        year, month = divmod(key, 12)
+        return f"{1970 + year:04d}-{month + 1:02d}"
+    return date.fromordinal(_bucket_start(key, granularity)).isoformat()
+
+
+class _Rollup:
+    """
+    Counts per bucket at one granularity.
+
+    Totals, moods and models are dense arrays over every bucket from the first
+    entry to the last, with prefix sums so any bucket range costs O(1) per
+    label. Tags are sparse (bucket, tag, count) triples sorted by bucket, so
+    a range is one contiguous slice.
+    """
+
+    def __init__(self, granularity, days, moods, models, n_moods, n_models,
+                 tag_entries, tag_ids, n_tags):
+        self.granularity = granularity
+        keys = _bucket_keys(days, granularity)
+        self.first = int(keys.min()) if len(keys) else 0
+        n_buckets = int(keys.max()) - self.first + 1 if len(keys) else 0
+        index = keys - self.first
+        self.counts = np.bincount(index, minlength=n_buckets).astype(np.int64)
+        self.moods = np.zeros((n_buckets, n_moods), np.int64)
+        np.add.at(self.moods, (index, moods), 1)
+        self.models = np.zeros((n_buckets, n_models), np.int64)
+        np.add.at(self.models, (index, models), 1)
+        # Leading zero row: sum over buckets [a, b) is cum[b] - cum[a]
+        self.counts_cum = np.concatenate(([0], np.cumsum(self.counts)))
+        self.moods_cum = np.vstack((np.zeros((1, n_moods), np.int64), np.cumsum(self.moods, axis=0)))
+        self.models_cum = np.vstack((np.zeros((1, n_models), np.int64), np.cumsum(self.models, axis=0)))
+
+        pair_keys = index[tag_entries] * max(n_tags, 1) + tag_ids
+        pairs, pair_counts = np.unique(pair_keys, return_counts=True)
+        self.tag_bucket = pairs // max(n_tags, 1)
+        self.tag_id = pairs % max(n_tags, 1)
+        self.tag_count = pair_counts.astype(np.int64)
+        self.n_buckets = n_buckets
+        self.labels = [_bucket_label(self.first + i, granularity) for i in range(n_buckets)]
+
+    def clip(self, key_lo, key_hi):
+        """Bucket indexes [a, b) for bucket keys [key_lo, key_hi), clipped to the data."""
+        return (min(max(key_lo - self.first, 0), self.n_buckets),
+                min(max(key_hi - self.first, 0), self.n_buckets))
+
+    def tag_slice(self, a, b):
+        lo, hi = np.searchsorted(self.tag_bucket, (a, b))
+        return slice(lo, hi)
+
+
+class JournalAnalytics:
+    """
+    Columnar snapshot of a journal with daily, weekly and monthly rollups.
+
+    Each entry is one row of parallel arrays: day ordinal, mood id, model id,
+    plus a CSR layout (offsets into one flat array) for tag ids. Rollups are
+    computed once when the snapshot is built; queries never look at entries.
+    Entries without a parseable timestamp count in `undated` only.
+    """
+
+    def __init__(self, entries: Sequence[Dict]):
+        self.moods = _Vocab()
+        self.models = _Vocab()
+        self.tags = _Vocab()
+        n = len(entries)
+        days = np.empty(n, np.int32)
+        mood_ids = np.empty(n, np.int32)
+        model_ids = np.empty(n, np.int32)
+        tag_offsets = np.zeros(n + 1, np.int64)
+        tag_ids = []
+        day_of = {}  # "YYYY-MM-DD" -> ordinal, parsed once per distinct day
+        for row, entry in enumerate(entries):
+            prefix = (entry.get("timestamp") or "")[:10]
+            day = day_of.get(prefix)
+            if day is None:
+                try:
+                    day = date.fromisoformat(prefix).toordinal()
+                except ValueError:
+                    day = -1
+                day_of[prefix] = day
+            days[row] = day
+            mood_ids[row] = self.moods.id(entry.get("mood") or "unknown")
+            model_ids[row] = self.models.id(entry.get("model_used") or "unknown")
+            tag_ids.extend(self.tags.id(tag) for tag in entry.get("tags") or ())
+            tag_offsets[row + 1] = len(tag_ids)
+
+        self.total = n
+        self.days = days
+        self.mood_ids = mood_ids
+        self.model_ids = model_ids
+        self.tag_offsets = tag_offsets
+        self.tag_ids = np.asarray(tag_ids, np.int32)
+
+        dated = days >= 0
+        self.undated = int(n - dated.sum())
+        tag_entries = np.repeat(np.arange(n), np.diff(tag_offsets))
+        tag_dated = dated[tag_entries]
+        # Entry rows renumbered to dated-only positions for the rollups
+        dated_row = np.cumsum(dated) - 1
+        self.rollups = {
+            granularity: _Rollup(granularity, days[dated], mood_ids[dated], model_ids[dated],
+                                 len(self.moods.names), len(self.models.names),
+                                 dated_row[tag_entries[tag_dated]], self.tag_ids[tag_dated],
+                                 len(self.tags.names))
+            for granularity in GRANULARITIES
+        }
+
+    # ---------- range queries ----------
+
+    def _day_range(self, since, until) -> Tuple[int, int]:
+        days = self.rollups["day"]
+        lo = _parse_day(since)
+        hi = _parse_day(until)
+        return (days.first if lo is None else lo,
+                days.first + days.n_buckets if hi is None else hi)
+
+    def _tag_counts(self, lo: int, hi: int) -> np.ndarray:
+        """Tag counts for days [lo, hi): whole months from the monthly rollup, edges from the daily one."""
+        n_tags = len(self.tags.names)
+        total = np.zeros(n_tags, np.int64)
+        if lo >= hi or not n_tags:
+            return total
+        day_rollup, month_rollup = self.rollups["day"], self.rollups["month"]
+        month_lo = int(_bucket_keys(np.array([lo]), "month")[0])
+        if _bucket_start(month_lo, "month") < lo:
+            month_lo += 1
+        month_hi = int(_bucket_keys(np.array([hi]), "month")[0])
+        if month_lo < month_hi:
+            spans = [(day_rollup, lo, _bucket_start(month_lo, "month")),
+                     (month_rollup, month_lo, month_hi),
+                     (day_rollup, _bucket_start(month_hi, "month"), hi)]
+        else:
+            spans = [(day_rollup, lo, hi)]
+        for rollup, key_lo, key_hi in spans:
+            a, b = rollup.clip(key_lo, key_hi)
+            if a < b:
+                part = rollup.tag_slice(a, b)
+                total += np.bincount(rollup.tag_id[part], weights=rollup.tag_count[part],
+                                     minlength=n_tags).astype(np.int64)
+        return total
+
+    def summary(self, since: Optional[str] = None, until: Optional[str] = None,
+                top_tags: int = 5) -> Dict:
+        """
+        Statistics for entries dated in [since, until), in the shape of get_statistics.
+
+        Args:
+            since: First day included (YYYY-MM-DD; longer timestamps are cut to the day)
+            until: First day excluded
+            top_tags: Number of most common tags to include
+        """
+        lo, hi = self._day_range(since, until)
+        days = self.rollups["day"]
+        a, b = days.clip(lo, hi)
+        moods = days.moods_cum[b] - days.moods_cum[a]
+        models = days.models_cum[b] - days.models_cum[a]
+        tags = self._tag_counts(lo, hi)
+        top = np.argsort(-tags, kind="stable")[:top_tags]
+        active = np.flatnonzero(days.counts[a:b]) + a
+        return {
+            "total_dreams": int(days.counts_cum[b] - days.counts_cum[a]),
+            "most_common_tags": {self.tags.names[t]: int(tags[t]) for t in top if tags[t]},
+            "mood_distribution": {self.moods.names[m]: int(c) for m, c in enumerate(moods) if c},
+            "dream_frequency": dict(zip([days.labels[i] for i in active], days.counts[active].tolist())),
+            "models_used": {self.models.names[m]: int(c) for m, c in enumerate(models) if c},
+        }
+
+    def series(self, granularity: str = "day", since: Optional[str] = None,
+               until: Optional[str] = None, tags: Optional[List[str]] = None,
+               top_tags: int = 5) -> Dict:
+        """
+        Per-period trend series, one value per period including empty ones.
+
+        Periods are whole buckets: since and until are widened to the start of
+        their week or month. Weeks start on Monday and are labelled by that day.
+
+        Args:
+            granularity: "day", "week" or "month"
+            since: First day included (YYYY-MM-DD)
+            until: First day excluded
+            tags: Tags to chart (default: the range's most common tags)
+            top_tags: How many tags to chart when `tags` is not given
+        """
+        if granularity not in self.rollups:
+            raise ValueError(f"Invalid granularity: {granularity!r} (expected day, week or month)")
+        rollup = self.rollups[granularity]
+        lo, hi = self._day_range(since, until)
+        key_lo = int(_bucket_keys(np.array([lo]), granularity)[0])
+        key_hi = int(_bucket_keys(np.array([hi - 1]), granularity)[0]) + 1 if hi > lo else key_lo
+        a, b = rollup.clip(key_lo, key_hi)
+
+        if tags is None:
+            counts = self._tag_counts(_bucket_start(rollup.first + a, granularity),
+                                      _bucket_start(rollup.first + b, granularity))
+            chosen = [int(t) for t in np.argsort(-counts, kind="stable")[:top_tags] if counts[t]]
+        else:
+            chosen = [self.tags.ids[tag] for tag in tags if tag in self.tags.ids]
+        part = rollup.tag_slice(a, b)
+        buckets, ids, weights = rollup.tag_bucket[part] - a, rollup.tag_id[part], rollup.tag_count[part]
+        tag_series = {}
+        for t in chosen:
+            mask = ids == t
+            tag_series[self.tags.names[t]] = np.bincount(
+                buckets[mask], weights=weights[mask], minlength=b - a).astype(np.int64).tolist()
+        for tag in tags or ():
+            tag_series.setdefault(tag, [0] * (b - a))
+
+        moods = rollup.moods[a:b]
+        models = rollup.models[a:b]
+        return {
+            "granularity": granularity,
+            "periods": rollup.labels[a:b],
+            "total": rollup.counts[a:b].tolist(),
+            "moods": {name: moods[:, m].tolist() for m, name in enumerate(self.moods.names)
+                      if moods[:, m].any()},
+            "models": {name: models[:, m].tolist() for m, name in enumerate(self.models.names)
+                       if models[:, m].any()},
+            "tags": tag_series,
+        }
@@ -0,0 +1,98 @@
+import json
+from collections import Counter
+from typing import Dict, List
+
+from journal_store import write_json_atomic
+
+
+class JournalStats:
+    """
+    Running aggregates over the dream journal.
+
+    Counters are updated once per recorded dream and persisted next to the
+    journal, so reading statistics never scans the entries. They are rebuilt
+    from the journal only when they no longer match it.
+    """
+
+    def __init__(self, path: str = "dream_journal.stats.json"):
+        self.path = path
+        self.total = 0
+        self.last_timestamp = None
+        self.tags = Counter()
+        self.moods = Counter()
+        self.models = Counter()
+        self.days = Counter()
+
+    def add(self, entry: Dict) -> None:
+        """
+        Fold one journal entry into the aggregates.
+
+        Args:
+            entry: Journal entry dictionary
+        """
+        self.total += 1
+        self.last_timestamp = entry.get('timestamp')
+        self.tags.update(entry.get('tags', []))
+        self.moods[entry.get('mood', 'unknown')] += 1
+        self.models[entry.get('model_used', 'unknown')] += 1
+        self.days[entry.get('timestamp', '')[:10]] += 1  # YYYY-MM-DD
+
+    def rebuild(self, entries: List[Dict]) -> None:
+        """Recompute every aggregate from the full journal."""
+        self.__init__(self.path)
+        for entry in entries:
+            self.add(entry)
+
+    def matches(self, entries: List[Dict]) -> bool:
+        """Check that the aggregates describe exactly these entries."""
+        if self.total != len(entries):
+            return False
+        return not entries or self.last_timestamp == entries[-1].get('timestamp')
+
+    def load(self, entries: List[Dict]) -> None:
+        """
+        Load persisted aggregates, rebuilding them if they are stale or missing.
+
+        Args:
+            entries: The journal the aggregates should describe
+        """
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.total = data['total']
+            self.last_timestamp = data['last_timestamp']
+            self.tags = Counter(data['tags'])
+            self.moods = Counter(data['moods'])
+            self.models = Counter(data['models'])
+            self.days = Counter(data['days'])
+        except (FileNotFoundError, KeyError, TypeError, json.JSONDecodeError):
+            self.total = -1
+        if not self.matches(entries):
+            self.rebuild(entries)
+            self.save()
+
+    def save(self) -> None:
+        write_json_atomic(self.path, {
+            'total': self.total,
+            'last_timestamp': self.last_timestamp,
+            'tags': self.tags,
+            'moods': self.moods,
+            'models': self.models,
+            'days': self.days,
+        }, indent=None)
+
+    def summary(self, top_tags: int = 5) -> Dict:
+        """
+        Return statistics in the shape of DreamJournalAI.get_statistics.
+
+        Args:
+            top_tags: Number of most common tags to include
+        """
+        return {
+            "total_dreams": self.total,
+            # Counter.most_common(k) is a heap selection, not a full sort
+            "most_common_tags": dict(self.tags.most_common(top_tags)),
+            "mood_distribution": dict(self.moods),
+            "dream_frequency": dict(self.days),
+            "models_used": dict(self.models),
+        }
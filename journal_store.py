@@ -0,0 +1,487 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process locks apply
+    fcntl = None
+
+
+def _matches(entry, mood=None, tag=None, since=None, until=None):
+    if mood and entry.get("mood") != mood:
+        return False
+    if tag and tag not in entry.get("tags", []):
+        return False
+    timestamp = entry.get("timestamp", "")
+    if since and timestamp < since:
+        return False
+    if until and timestamp >= until:
+        return False
+    return True
+
+
+def paginate_entries(entries, limit=None, after=None, mood=None, tag=None, since=None, until=None,
+                     before=None, newest_first=False):
+    """
+    Return (page, next_cursor) over an in-memory list; ids are 1-based
+    positions. Pages newest-first hand back a cursor for ?before=.
+    """
+    low = after or 0
+    high = len(entries) if before is None else min(before - 1, len(entries))
+    positions = range(high, low, -1) if newest_first else range(low + 1, high + 1)
+    page = []
+    next_cursor = None
+    for position in positions:
+        entry = entries[position - 1]
+        if not _matches(entry, mood, tag, since, until):
+            continue
+        if limit is not None and len(page) == limit:
+            next_cursor = page[-1]["id"]
+            break
+        page.append(dict(entry, id=position))
+    return page, next_cursor
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """Advisory flock on path, so writers in other processes (gunicorn workers) wait their turn."""
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # releases the lock
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+class JsonLogStore:
+    """Journal stored as a JSON snapshot plus an append-only JSON Lines log."""
+
+    # Fold the append-only log into the snapshot after this many saves.
+    COMPACT_EVERY = 500
+
+    def __init__(self, filepath="dream_journal.json"):
+        # dream_journal.json is the compacted snapshot (a plain JSON list, so
+        # existing journals work as-is); new entries are appended to the
+        # .jsonl log next to it and folded in periodically.
+        self.filepath = filepath
+        self.logpath = os.path.splitext(filepath)[0] + ".jsonl"
+        self.compacting_path = self.logpath + ".compacting"
+        self.lockpath = self.logpath + ".lock"
+        # Generation counter, bumped whenever the files change other than by
+        # an append; with the log's size it versions the journal
+        self.genpath = self.logpath + ".gen"
+        # Threads in this process share _lock; other processes are kept out by
+        # an exclusive flock for writes and a shared one for reads.
+        self._lock = threading.Lock()
+        with file_lock(self.lockpath):
+            if not os.path.exists(self.filepath):
+                self._write_snapshot([])
+            self._recover_compaction()
+            self._trim_torn_line(self.logpath)
+            self._log_records = len(self._read_log(self.logpath))
+
+    def append(self, entry):
+        line = json.dumps(entry) + "\n"
+        with self._lock, file_lock(self.lockpath):
+            self._trim_torn_line(self.logpath)
+            with open(self.logpath, "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._log_records += 1
+            if self._log_records >= self.COMPACT_EVERY:
+                self._compact()
+        return entry
+
+    def import_entries(self, entries):
+        lines = "".join(json.dumps(entry) + "\n" for entry in entries)
+        with self._lock, file_lock(self.lockpath):
+            self._trim_torn_line(self.logpath)
+            with open(self.logpath, "a") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self._log_records += len(entries)
+            if self._log_records >= self.COMPACT_EVERY:
+                self._compact()
+
+    def load(self):
+        with file_lock(self.lockpath, shared=True):
+            return (self._read_snapshot()
+                    + self._read_log(self.compacting_path)
+                    + self._read_log(self.logpath))
+
+    def query(self, limit=None, after=None, mood=None, tag=None, since=None, until=None,
+              before=None, newest_first=False):
+        """Return (entries, next_cursor); ids are 1-based journal positions."""
+        return paginate_entries(self.load(), limit, after, mood, tag, since, until,
+                                before, newest_first)
+
+    def read_since(self, cursor=None):
+        """
+        Entries appended since an earlier call, for following the journal
+        without re-reading it: returns (position of the first one, entries,
+        cursor for the next call). Only the log tail is read unless the
+        snapshot changed (compaction or rewrite()) since cursor, in which case
+        every entry is returned from position 0.
+        """
+        with file_lock(self.lockpath, shared=True):
+            base = self._generation()
+            if cursor is not None and cursor[0] == base:
+                _, offset, start = cursor
+                entries, offset = self._read_log_from(self.logpath, offset)
+                return start, entries, (base, offset, start + len(entries))
+            entries = self._read_snapshot() + self._read_log(self.compacting_path)
+            tail, offset = self._read_log_from(self.logpath, 0)
+            entries += tail
+            return 0, entries, (base, offset, len(entries))
+
+    def version_key(self):
+        """
+        (generation, log size): changes on every write from any process, and
+        never repeats, since the log only grows until the generation is bumped.
+        """
+        with file_lock(self.lockpath, shared=True):
+            return self._generation(), _file_size(self.logpath)
+
+    def compact(self):
+        """Fold the append-only log into the snapshot file."""
+        with self._lock, file_lock(self.lockpath):
+            self._compact()
+
+    def rewrite(self, transform):
+        """
+        Edit every entry in place under the write lock: transform gets the
+        full list, and its return value is passed back.
+        """
+        with self._lock, file_lock(self.lockpath):
+            # Compacting first leaves a single file to replace atomically
+            self._compact()
+            entries = self._read_snapshot()
+            result = transform(entries)
+            self._write_snapshot(entries)
+        return result
+
+    # ---------- storage helpers ----------
+
+    def _compact(self):
+        # Move the live log aside first so a crash at any point leaves either
+        # the old snapshot + log or the new snapshot, never a lost entry.
+        if not os.path.exists(self.compacting_path):
+            if not os.path.exists(self.logpath):
+                return
+            self._bump_generation()  # the log is about to restart from empty
+            os.replace(self.logpath, self.compacting_path)
+        pending = self._read_log(self.compacting_path)
+        self._write_snapshot(self._read_snapshot() + pending)
+        os.remove(self.compacting_path)
+        self._log_records = 0
+
+    def _recover_compaction(self):
+        # A leftover .compacting file means an earlier compaction was
+        # interrupted; finish it unless the snapshot already holds its records.
+        if not os.path.exists(self.compacting_path):
+            return
+        pending = self._read_log(self.compacting_path)
+        snapshot = self._read_snapshot()
+        if pending and snapshot[-len(pending):] == pending:
+            os.remove(self.compacting_path)
+        else:
+            self._compact()
+
+    def _read_snapshot(self):
+        try:
+            with open(self.filepath) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def _read_log(self, path):
+        entries = []
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Torn final line from a crash mid-append
+                        continue
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _trim_torn_line(self, path):
+        # A crash mid-append leaves a last line without its newline; cut it
+        # off before appending, or the next record would be glued onto it and
+        # both lost together. Caller holds the exclusive lock.
+        try:
+            with open(path, "rb+") as f:
+                end = f.seek(0, os.SEEK_END)
+                if not end:
+                    return
+                f.seek(end - 1)
+                if f.read(1) == b"\n":
+                    return
+                keep = end
+                while keep > 0:
+                    block = min(keep, 1 << 16)
+                    f.seek(keep - block)
+                    newline = f.read(block).rfind(b"\n")
+                    if newline != -1:
+                        keep = keep - block + newline + 1
+                        break
+                    keep -= block
+                print(f"INFO: dropping {end - keep} bytes of a torn record from {path}")
+                f.truncate(keep)
+            self._bump_generation()
+        except FileNotFoundError:
+            pass
+
+    def _read_log_from(self, path, offset):
+        # Records after byte offset, and the offset just past the last
+        # complete line (a torn tail is cut off by the next append)
+        entries = []
+        try:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return entries, offset
+
+    def _write_snapshot(self, entries):
+        write_json_atomic(self.filepath, entries)
+        self._bump_generation()
+
+    def _generation(self):
+        try:
+            with open(self.genpath) as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _bump_generation(self):
+        # Caller holds the exclusive lock
+        write_json_atomic(self.genpath, self._generation() + 1)
+
+
+class SQLiteStore:
+    """Journal stored in SQLite with indexes on timestamp, mood and tags."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        mood TEXT,
+        body TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_entries_timestamp ON entries(timestamp);
+    CREATE INDEX IF NOT EXISTS idx_entries_mood ON entries(mood, id);
+    CREATE TABLE IF NOT EXISTS entry_tags (
+        entry_id INTEGER NOT NULL REFERENCES entries(id),
+        tag TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_entry_tags_tag ON entry_tags(tag, entry_id);
+    CREATE TABLE IF NOT EXISTS journal_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO journal_version (id, version) VALUES (1, 0);
+    """
+
+    def __init__(self, dbpath="dream_journal.db", import_from=None):
+        self.dbpath = dbpath
+        self._local = threading.local()
+        is_new = not os.path.exists(dbpath)
+        conn = self._conn()
+        conn.executescript(self.SCHEMA)
+        conn.commit()
+        # First run against an existing JSON journal: migrate it in.
+        if is_new and import_from and os.path.exists(import_from):
+            self.import_entries(JsonLogStore(import_from).load())
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across Flask's worker threads.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.dbpath, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _insert(self, conn, entry):
+        cursor = conn.execute(
+            "INSERT INTO entries (timestamp, mood, body) VALUES (?, ?, ?)",
+            (entry.get("timestamp", ""), entry.get("mood"), json.dumps(entry)),
+        )
+        conn.executemany(
+            "INSERT INTO entry_tags (entry_id, tag) VALUES (?, ?)",
+            [(cursor.lastrowid, tag) for tag in set(entry.get("tags", []))],
+        )
+
+    def _bump_version(self, conn):
+        # In the writing transaction, so the version commits with the data
+        conn.execute("UPDATE journal_version SET version = version + 1")
+
+    def append(self, entry):
+        conn = self._conn()
+        with conn:
+            self._insert(conn, entry)
+            self._bump_version(conn)
+        return entry
+
+    def import_entries(self, entries):
+        conn = self._conn()
+        with conn:
+            for entry in entries:
+                self._insert(conn, entry)
+            self._bump_version(conn)
+
+    def load(self):
+        rows = self._conn().execute("SELECT body FROM entries ORDER BY id")
+        return [json.loads(body) for (body,) in rows]
+
+    def query(self, limit=None, after=None, mood=None, tag=None, since=None, until=None,
+              before=None, newest_first=False):
+        """Return (entries, next_cursor) using the entry id as the cursor."""
+        clauses = ["id > ?"]
+        params = [after or 0]
+        if before:
+            clauses.append("id < ?")
+            params.append(before)
+        if mood:
+            clauses.append("mood = ?")
+            params.append(mood)
+        if tag:
+            clauses.append("id IN (SELECT entry_id FROM entry_tags WHERE tag = ?)")
+            params.append(tag)
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        sql = "SELECT id, body FROM entries WHERE " + " AND ".join(clauses) + " ORDER BY id"
+        if newest_first:
+            sql += " DESC"
+        if limit is not None:
+            # Fetch one extra row to know whether another page exists.
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+        rows = self._conn().execute(sql, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1][0]
+        return [dict(json.loads(body), id=row_id) for row_id, body in rows], next_cursor
+
+    def read_since(self, cursor=None):
+        """(position of the first entry, entries appended after cursor, new cursor)."""
+        start = cursor or 0
+        rows = self._conn().execute("SELECT id, body FROM entries WHERE id > ? ORDER BY id",
+                                    (start,)).fetchall()
+        return start, [json.loads(body) for _, body in rows], rows[-1][0] if rows else start
+
+    def version_key(self):
+        """Write counter kept in the database, bumped by every write transaction."""
+        return self._conn().execute("SELECT version FROM journal_version").fetchone()[0]
+
+    def compact(self):
+        self._conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def rewrite(self, transform):
+        """Edit every entry in place in one transaction (ids are kept, so the count must be)."""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute("SELECT id, body FROM entries ORDER BY id").fetchall()
+            entries = [json.loads(body) for _, body in rows]
+            result = transform(entries)
+            if len(entries) != len(rows):
+                raise ValueError("rewrite can't add or remove entries")
+            conn.executemany(
+                "UPDATE entries SET timestamp = ?, mood = ?, body = ? WHERE id = ?",
+                [(entry.get("timestamp", ""), entry.get("mood"), json.dumps(entry), row_id)
+                 for (row_id, _), entry in zip(rows, entries)],
+            )
+            conn.execute("DELETE FROM entry_tags")
+            conn.executemany(
+                "INSERT INTO entry_tags (entry_id, tag) VALUES (?, ?)",
+                [(row_id, tag) for (row_id, _), entry in zip(rows, entries)
+                 for tag in set(entry.get("tags", []))],
+            )
+            self._bump_version(conn)
+        return result
+
+
+def write_json_atomic(path, data, indent=2):
+    """Write JSON to path via temp file + fsync + rename."""
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def open_store(filepath="dream_journal.json", backend=None):
+    """Open the journal store selected by backend or $JOURNAL_BACKEND."""
+    backend = (backend or os.getenv("JOURNAL_BACKEND", "json")).lower()
+    if backend == "sqlite":
+        return SQLiteStore(os.path.splitext(filepath)[0] + ".db", import_from=filepath)
+    if backend == "json":
+        return JsonLogStore(filepath)
+    raise ValueError(f"Unknown journal backend: {backend}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import/export the dream journal as JSON.")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("path", help="JSON file to read from or write to")
+    parser.add_argument("--journal", default="dream_journal.json")
+    parser.add_argument("--backend", default=None, help="json or sqlite (default: $JOURNAL_BACKEND)")
+    args = parser.parse_args()
+
+    store = open_store(args.journal, args.backend)
+    if args.action == "export":
+        write_json_atomic(args.path, store.load())
+        print(f"Exported journal to {args.path}")
+    else:
+        with open(args.path) as f:
+            entries = json.load(f)
+        store.import_entries(entries)
+        print(f"Imported {len(entries)} entries")
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class LLMCache:
+    """Two-tier (memory LRU + size-bounded disk) cache for LLM responses."""
+
+    def __init__(self, directory=".llm_cache", memory_items=256,
+                 disk_max_bytes=64 * 1024 * 1024, ttl=7 * 24 * 3600, enabled=True):
+        self.directory = directory
+        # Disabled: every lookup misses and nothing is stored, but stats() still works
+        self.enabled = enabled
+        self.memory_items = memory_items
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (created, value)
+        self._disk = OrderedDict()  # key -> size in bytes, least recently used first
+        self._disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        # The disk index is built on first use, so creating a cache costs no I/O
+        self._scanned = False
+        self._scan_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(provider, model, system, prompt, temperature=None, max_tokens=None):
+        """Content address for one completion request."""
+        payload = json.dumps([provider, model, system, prompt, temperature, max_tokens])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if not self.enabled:
+            with self._lock:
+                self.misses += 1
+            return None
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None and now - item[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                self.bytes_saved += len(item[1].encode("utf-8"))
+                return item[1]
+            if item is not None:
+                del self._memory[key]
+
+        item = self._read_disk(key, now)
+        with self._lock:
+            if item is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self.bytes_saved += len(item[1].encode("utf-8"))
+            self._remember(key, item)
+        return item[1]
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        created = time.time()
+        with self._lock:
+            self._remember(key, (created, value))
+        self._write_disk(key, created, value)
+
+    def stats(self):
+        self._scan_disk()
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / total if total else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "memory_items": len(self._memory),
+            "disk_items": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+        }
+
+    # ---------- tiers ----------
+
+    def _remember(self, key, item):
+        self._memory[key] = item
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _scan_disk(self):
+        # Rebuild the LRU order from file mtimes (touched on every disk hit),
+        # once, before the first disk read or write.
+        if self._scanned:
+            return
+        with self._scan_lock:
+            if self._scanned:
+                return
+            found = []
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith(".json"):
+                        st = os.stat(os.path.join(root, name))
+                        found.append((st.st_mtime, name[:-5], st.st_size))
+            with self._lock:
+                for _, key, size in sorted(found):
+                    self._disk[key] = size
+                    self._disk_bytes += size
+            self._scanned = True
+
+    def _read_disk(self, key, now):
+        self._scan_disk()
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if now - data["created"] >= self.ttl:
+            self._drop_disk(key)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        return data["created"], data["value"]
+
+    def _write_disk(self, key, created, value):
+        self._scan_disk()
+        path = self._path(key)
+        body = json.dumps({"created": created, "value": value})
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        evicted = []
+        with self._lock:
+            self._disk_bytes += len(body) - self._disk.pop(key, 0)
+            self._disk[key] = len(body)
+            while self._disk_bytes > self.disk_max_bytes and len(self._disk) > 1:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            self._remove_file(old_key)
+
+    def _drop_disk(self, key):
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+        self._remove_file(key)
+
+    def _remove_file(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
@@ -0,0 +1,653 @@
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+import weakref
+
+import metrics
+from llm_cache import LLMCache
+
+
+class ProviderError(RuntimeError):
+    """
+    An upstream call failed; retryable errors are rate limits and 5xx responses.
+    `local` marks calls our own rate limiter turned away without sending.
+    """
+
+    def __init__(self, message, status=None, retryable=False, model_unavailable=False, local=False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.model_unavailable = model_unavailable
+        self.local = local
+
+
+def classify_error(error):
+    """Wrap an SDK exception in a ProviderError describing how to handle it."""
+    if isinstance(error, ProviderError):
+        return error
+    status = None
+    for attr in ("status_code", "code", "status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            status = value
+            break
+    text = str(error).lower()
+    if status is None:
+        for code in (429, 500, 502, 503, 504):
+            if str(code) in text:
+                status = code
+                break
+    model_unavailable = ("model_decommissioned" in text or "model_not_found" in text
+                         or (status == 404 and "model" in text))
+    retryable = (status == 429 or (status is not None and status >= 500)
+                 or "rate limit" in text or "overloaded" in text or "timed out" in text)
+    return ProviderError(str(error), status=status, retryable=retryable,
+                         model_unavailable=model_unavailable)
+
+
+class TokenBucket:
+    """Token-bucket rate limiter: `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take one token, waiting up to timeout seconds; return False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._try_take()
+            if not wait:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def _try_take(self):
+        """Take a token if one is available; otherwise return seconds until one is."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    async def acquire_async(self, timeout=None):
+        """Like acquire(), but waits with asyncio.sleep instead of blocking the thread."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._try_take()
+            if not wait:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+
+class _NoLimit:
+    """Stands in for the semaphore of a provider without a concurrency cap."""
+
+    def acquire(self, timeout=None):
+        return True
+
+    def release(self):
+        pass
+
+
+_NO_LIMIT = _NoLimit()
+
+
+# ---------- providers ----------
+
+class Provider:
+    """One upstream LLM API. Clients are built once, on first use, and reused."""
+
+    name = None
+
+    def __init__(self):
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self.build_client()
+        return self._client
+
+    def build_client(self):
+        raise NotImplementedError
+
+    def complete(self, model, system, prompt, temperature=None, max_tokens=None):
+        raise NotImplementedError
+
+    def record_usage(self, model, system, prompt, text, prompt_tokens=None, completion_tokens=None):
+        """Count one call's tokens, estimating them when the API doesn't report usage."""
+        if prompt_tokens is None:
+            prompt_tokens = metrics.estimate_tokens(system) + metrics.estimate_tokens(prompt)
+        if completion_tokens is None:
+            completion_tokens = metrics.estimate_tokens(text)
+        metrics.LLM_TOKENS.inc(prompt_tokens, self.name, model, "prompt")
+        metrics.LLM_TOKENS.inc(completion_tokens, self.name, model, "response")
+
+    def stream(self, model, system, prompt, temperature=None, max_tokens=None):
+        # Providers without streaming support yield the whole response at once.
+        yield self.complete(model, system, prompt, temperature, max_tokens)
+
+    async def acomplete(self, model, system, prompt, temperature=None, max_tokens=None):
+        # Providers without a native async client run the blocking call in a thread.
+        return await asyncio.to_thread(self.complete, model, system, prompt, temperature, max_tokens)
+
+
+class _ChatCompletionsProvider(Provider):
+    """Shared code for OpenAI-compatible chat completion APIs."""
+
+    def __init__(self, api_key):
+        super().__init__()
+        self.api_key = api_key
+        self._async_client = None
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            with self._client_lock:
+                if self._async_client is None:
+                    self._async_client = self.build_async_client()
+        return self._async_client
+
+    def build_async_client(self):
+        raise NotImplementedError
+
+    def _kwargs(self, model, system, prompt, temperature, max_tokens, **extra):
+        messages = [{"role": "user", "content": prompt}]
+        if system:
+            messages.insert(0, {"role": "system", "content": system})
+        kwargs = {"model": model, "messages": messages, **extra}
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        return kwargs
+
+    def _request(self, model, system, prompt, temperature, max_tokens, **extra):
+        return self.client.chat.completions.create(
+            **self._kwargs(model, system, prompt, temperature, max_tokens, **extra))
+
+    def _text(self, response, model, system, prompt):
+        text = response.choices[0].message.content.strip()
+        usage = getattr(response, "usage", None)
+        self.record_usage(model, system, prompt, text, getattr(usage, "prompt_tokens", None),
+                          getattr(usage, "completion_tokens", None))
+        return text
+
+    async def acomplete(self, model, system, prompt, temperature=None, max_tokens=None):
+        response = await self.async_client.chat.completions.create(
+            **self._kwargs(model, system, prompt, temperature, max_tokens))
+        return self._text(response, model, system, prompt)
+
+    def complete(self, model, system, prompt, temperature=None, max_tokens=None):
+        response = self._request(model, system, prompt, temperature, max_tokens)
+        return self._text(response, model, system, prompt)
+
+    def stream(self, model, system, prompt, temperature=None, max_tokens=None):
+        parts = []
+        for chunk in self._request(model, system, prompt, temperature, max_tokens, stream=True):
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                parts.append(text)
+                yield text
+        self.record_usage(model, system, prompt, "".join(parts))
+
+
+class GroqProvider(_ChatCompletionsProvider):
+    name = "groq"
+
+    def build_client(self):
+        from groq import Groq
+        return Groq(api_key=self.api_key)
+
+    def build_async_client(self):
+        from groq import AsyncGroq
+        return AsyncGroq(api_key=self.api_key)
+
+
+class OpenAIProvider(_ChatCompletionsProvider):
+    name = "openai"
+
+    def build_client(self):
+        from openai import OpenAI
+        return OpenAI(api_key=self.api_key)
+
+    def build_async_client(self):
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=self.api_key)
+
+
+class GeminiProvider(Provider):
+    name = "gemini"
+
+    def __init__(self, api_key):
+        super().__init__()
+        self.api_key = api_key
+        self._models = {}
+
+    def build_client(self):
+        import google.generativeai as genai
+        genai.configure(api_key=self.api_key)
+        return genai
+
+    def _model(self, model, system):
+        key = (model, system)
+        if key not in self._models:
+            self._models[key] = self.client.GenerativeModel(model, system_instruction=system or None)
+        return self._models[key]
+
+    def _config(self, temperature, max_tokens):
+        config = {}
+        if temperature is not None:
+            config["temperature"] = temperature
+        if max_tokens is not None:
+            config["max_output_tokens"] = max_tokens
+        return config or None
+
+    def _record(self, usage, model, system, prompt, text):
+        self.record_usage(model, system, prompt, text, getattr(usage, "prompt_token_count", None),
+                          getattr(usage, "candidates_token_count", None))
+
+    def complete(self, model, system, prompt, temperature=None, max_tokens=None):
+        response = self._model(model, system).generate_content(
+            prompt, generation_config=self._config(temperature, max_tokens))
+        text = response.text if hasattr(response, "text") else ""
+        self._record(getattr(response, "usage_metadata", None), model, system, prompt, text)
+        return text
+
+    def stream(self, model, system, prompt, temperature=None, max_tokens=None):
+        response = self._model(model, system).generate_content(
+            prompt, generation_config=self._config(temperature, max_tokens), stream=True)
+        parts = []
+        usage = None
+        for chunk in response:
+            usage = getattr(chunk, "usage_metadata", None) or usage  # totals arrive on the last chunk
+            text = chunk.text if hasattr(chunk, "text") else ""
+            if text:
+                parts.append(text)
+                yield text
+        self._record(usage, model, system, prompt, "".join(parts))
+
+    async def acomplete(self, model, system, prompt, temperature=None, max_tokens=None):
+        response = await self._model(model, system).generate_content_async(
+            prompt, generation_config=self._config(temperature, max_tokens))
+        text = response.text if hasattr(response, "text") else ""
+        self._record(getattr(response, "usage_metadata", None), model, system, prompt, text)
+        return text
+
+
+class FakeProvider(Provider):
+    """
+    Deterministic offline stand-in for load tests.
+
+    The same request always produces the same text. `latency` is seconds per
+    call, or a callable returning one (e.g. ``lambda: random.lognormvariate(-1, 0.5)``);
+    `failure_rate` makes that fraction of calls raise a retryable 503.
+    Pass `name` to stand in for a real provider (e.g. name="gemini").
+    """
+
+    name = "fake"
+
+    WORDS = ("moon", "river", "door", "forest", "mirror", "stairs", "ocean", "clock",
+             "feather", "lantern", "shadow", "garden", "train", "glass", "whisper", "storm")
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=0, words=60, name=None):
+        super().__init__()
+        if name:
+            self.name = name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.words = words
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.calls = 0
+
+    def build_client(self):
+        return self
+
+    def _text(self, model, system, prompt, max_tokens):
+        digest = hashlib.sha256(f"{model}\0{system}\0{prompt}".encode("utf-8")).digest()
+        count = min(self.words, max_tokens or self.words)
+        return " ".join(self.WORDS[digest[i % len(digest)] % len(self.WORDS)] for i in range(count))
+
+    def _draw(self):
+        with self._random_lock:
+            self.calls += 1
+            fail = self._random.random() < self.failure_rate
+        delay = self.latency() if callable(self.latency) else self.latency
+        return delay, fail
+
+    def _delay(self):
+        delay, fail = self._draw()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise ProviderError("fake upstream 503", status=503, retryable=True)
+
+    def complete(self, model, system, prompt, temperature=None, max_tokens=None):
+        self._delay()
+        text = self._text(model, system, prompt, max_tokens)
+        self.record_usage(model, system, prompt, text)
+        return text
+
+    def stream(self, model, system, prompt, temperature=None, max_tokens=None):
+        self._delay()
+        text = self._text(model, system, prompt, max_tokens)
+        for word in text.split(" "):
+            yield word + " "
+        self.record_usage(model, system, prompt, text)
+
+    async def acomplete(self, model, system, prompt, temperature=None, max_tokens=None):
+        delay, fail = self._draw()
+        if delay:
+            await asyncio.sleep(delay)
+        if fail:
+            raise ProviderError("fake upstream 503", status=503, retryable=True)
+        text = self._text(model, system, prompt, max_tokens)
+        self.record_usage(model, system, prompt, text)
+        return text
+
+
+# ---------- gateway ----------
+
+class LLMGateway:
+    """
+    Single entry point for LLM calls across providers.
+
+    A registered provider can get a token-bucket rate limit and a concurrency
+    cap. Retryable failures (429/5xx) are retried with exponential backoff
+    and jitter, and unavailable models fall through to the next model in the
+    requested order. Responses go through the shared LLMCache.
+    """
+
+    def __init__(self, cache=None, max_retries=4, backoff_base=0.5, backoff_cap=20.0,
+                 queue_timeout=30.0, async_queue_timeout=None):
+        self.cache = cache
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        # A blocked thread is expensive, so threaded callers give up after
+        # queue_timeout; a waiting coroutine is cheap, so async callers wait
+        # for a slot as long as async_queue_timeout allows (None: no limit).
+        self.queue_timeout = queue_timeout
+        self.async_queue_timeout = async_queue_timeout
+        self._providers = {}
+        self._dead_models = set()
+        self._lock = threading.Lock()
+        self._concurrency = {}
+        # event loop -> {provider name: asyncio.BoundedSemaphore}; entries go
+        # with their loop
+        self._async_slots = weakref.WeakKeyDictionary()
+
+    def register(self, provider, rate=None, burst=None, max_concurrency=None):
+        """
+        Add a provider. Local limits are opt-in, since the right numbers depend
+        on the account's quota with that provider: rate/burst/max_concurrency
+        default to $LLM_<NAME>_RPS, $LLM_<NAME>_BURST (default: one second's
+        worth) and $LLM_<NAME>_CONCURRENCY, and are off when unset. Without
+        them, upstream 429s are still retried with backoff.
+        """
+        prefix = f"LLM_{provider.name.upper()}_"
+        rate = rate or float(os.getenv(prefix + "RPS", "0"))
+        burst = burst or int(os.getenv(prefix + "BURST", "0")) or max(1, int(rate))
+        max_concurrency = max_concurrency or int(os.getenv(prefix + "CONCURRENCY", "0"))
+        with self._lock:
+            self._providers[provider.name] = (
+                provider,
+                TokenBucket(rate, burst) if rate else None,
+                threading.BoundedSemaphore(max_concurrency) if max_concurrency else _NO_LIMIT)
+            self._concurrency[provider.name] = max_concurrency or None
+        return provider
+
+    def has_provider(self, name):
+        return name in self._providers
+
+    def provider(self, name):
+        try:
+            return self._providers[name][0]
+        except KeyError:
+            raise ValueError(f"LLM provider not registered: {name}") from None
+
+    def first_available(self, provider, models):
+        """Return the first model in the list that hasn't been found unavailable."""
+        for model in models:
+            if (provider, model) not in self._dead_models:
+                return model
+        return None
+
+    def _models(self, provider, model, models):
+        ordered = list(models or [model])
+        usable = [m for m in ordered if (provider, m) not in self._dead_models]
+        if not usable:
+            raise ProviderError(f"No available model among {ordered}", model_unavailable=True)
+        return usable
+
+    def _slot(self, name):
+        provider, bucket, semaphore = self._providers[name]
+        if bucket is not None and not bucket.acquire(timeout=self.queue_timeout):
+            raise ProviderError(f"{name}: local rate limit wait exceeded", status=429, local=True)
+        if not semaphore.acquire(timeout=self.queue_timeout):
+            raise ProviderError(f"{name}: too many requests in flight", status=429, local=True)
+        return provider, semaphore
+
+    async def _async_slot(self, name):
+        # The async path shares the rate limit with threaded callers but caps
+        # concurrency with a per-event-loop semaphore, so waiting never blocks the loop.
+        provider, bucket, _ = self._providers[name]
+        if bucket is not None and not await bucket.acquire_async(timeout=self.async_queue_timeout):
+            raise ProviderError(f"{name}: local rate limit wait exceeded", status=429, local=True)
+        if self._concurrency[name] is None:
+            return provider, _NO_LIMIT
+        loop_slots = self._loop_slots(asyncio.get_running_loop())
+        slots = loop_slots.get(name)
+        if slots is None:
+            slots = loop_slots[name] = asyncio.BoundedSemaphore(self._concurrency[name])
+        try:
+            await asyncio.wait_for(slots.acquire(), self.async_queue_timeout)
+        except asyncio.TimeoutError:
+            raise ProviderError(f"{name}: too many requests in flight", status=429, local=True) from None
+        return provider, slots
+
+    def _loop_slots(self, loop):
+        with self._lock:
+            slots = self._async_slots.get(loop)
+            if slots is None:
+                # A new loop: drop the semaphores of loops that were closed but
+                # are still referenced somewhere
+                for closed in [other for other in self._async_slots if other.is_closed()]:
+                    del self._async_slots[closed]
+                slots = self._async_slots[loop] = {}
+            return slots
+
+    def _backoff_delay(self, attempt):
+        delay = min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    def _backoff(self, attempt):
+        time.sleep(self._backoff_delay(attempt))
+
+    @staticmethod
+    def _observe(name, model, started, error=None):
+        elapsed = time.perf_counter() - started
+        metrics.LLM_REQUEST_SECONDS.observe(elapsed, name, model, "error" if error else "ok")
+        if error is not None:
+            metrics.LLM_ERRORS.inc(1, name, model, str(error.status or "none"))
+
+    def _mark_dead(self, name, model, error):
+        print(f"Model {model} unavailable on {name} ({error}); trying next model")
+        with self._lock:
+            self._dead_models.add((name, model))
+
+    def complete(self, prompt, system="", provider="gemini", model=None, models=None,
+                 temperature=None, max_tokens=None, use_cache=True):
+        """
+        Run one completion.
+
+        Args:
+            prompt: User prompt
+            system: System message
+            provider: Registered provider name
+            model: Model id, or models: ordered fallback list of model ids
+            temperature, max_tokens: Sampling settings (provider default if None)
+            use_cache: Serve/store the response through the LLM cache
+
+        Returns:
+            Response text
+        """
+        self.provider(provider)
+        candidates = self._models(provider, model, models)
+        # Looked up under the preferred model but stored under the one that
+        # answers, so a fallback's response is never served as the preferred model's
+        key = LLMCache.make_key(provider, candidates[0], system, prompt, temperature, max_tokens)
+        if self.cache is not None and use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        last_error = None
+        for candidate in candidates:
+            for attempt in range(self.max_retries + 1):
+                client, semaphore = self._slot(provider)
+                started = time.perf_counter()
+                try:
+                    text = client.complete(candidate, system, prompt, temperature, max_tokens)
+                except Exception as e:
+                    last_error = classify_error(e)
+                    self._observe(provider, candidate, started, last_error)
+                else:
+                    self._observe(provider, candidate, started)
+                    if self.cache is not None and use_cache and text:
+                        self.cache.put(LLMCache.make_key(provider, candidate, system, prompt,
+                                                         temperature, max_tokens), text)
+                    return text
+                finally:
+                    semaphore.release()
+                if last_error.model_unavailable:
+                    self._mark_dead(provider, candidate, last_error)
+                    break
+                if not last_error.retryable or attempt == self.max_retries:
+                    raise last_error
+                self._backoff(attempt)
+        raise last_error
+
+    def stream(self, prompt, system="", provider="gemini", model=None, models=None,
+               temperature=None, max_tokens=None, use_cache=True):
+        """
+        Like complete(), but yield the response in chunks as they arrive.
+
+        Retries and model fallback apply only until the first chunk is sent.
+        """
+        self.provider(provider)
+        candidates = self._models(provider, model, models)
+        # Looked up under the preferred model but stored under the one that
+        # answers, so a fallback's response is never served as the preferred model's
+        key = LLMCache.make_key(provider, candidates[0], system, prompt, temperature, max_tokens)
+        if self.cache is not None and use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        last_error = None
+        for candidate in candidates:
+            for attempt in range(self.max_retries + 1):
+                client, semaphore = self._slot(provider)
+                parts = []
+                started = time.perf_counter()
+                try:
+                    for text in client.stream(candidate, system, prompt, temperature, max_tokens):
+                        if not parts:
+                            metrics.LLM_FIRST_TOKEN_SECONDS.observe(
+                                time.perf_counter() - started, provider, candidate)
+                        parts.append(text)
+                        yield text
+                except Exception as e:
+                    last_error = classify_error(e)
+                    self._observe(provider, candidate, started, last_error)
+                    if parts:
+                        raise last_error
+                else:
+                    self._observe(provider, candidate, started)
+                    if self.cache is not None and use_cache and parts:
+                        self.cache.put(LLMCache.make_key(provider, candidate, system, prompt,
+                                                         temperature, max_tokens), "".join(parts))
+                    return
+                finally:
+                    semaphore.release()
+                if last_error.model_unavailable:
+                    self._mark_dead(provider, candidate, last_error)
+                    break
+                if not last_error.retryable or attempt == self.max_retries:
+                    raise last_error
+                self._backoff(attempt)
+        raise last_error
+
+    async def acomplete(self, prompt, system="", provider="gemini", model=None, models=None,
+                        temperature=None, max_tokens=None, use_cache=True):
+        """
+        Async version of complete() for ASGI handlers; same retries, fallback and cache.
+
+        Cache lookups and writes touch the disk, so they run in a worker thread.
+        """
+        self.provider(provider)
+        candidates = self._models(provider, model, models)
+        # Looked up under the preferred model but stored under the one that
+        # answers, so a fallback's response is never served as the preferred model's
+        key = LLMCache.make_key(provider, candidates[0], system, prompt, temperature, max_tokens)
+        if self.cache is not None and use_cache:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                return cached
+
+        last_error = None
+        for candidate in candidates:
+            for attempt in range(self.max_retries + 1):
+                client, slots = await self._async_slot(provider)
+                started = time.perf_counter()
+                try:
+                    text = await client.acomplete(candidate, system, prompt, temperature, max_tokens)
+                except Exception as e:
+                    last_error = classify_error(e)
+                    self._observe(provider, candidate, started, last_error)
+                else:
+                    self._observe(provider, candidate, started)
+                    if self.cache is not None and use_cache and text:
+                        await asyncio.to_thread(self.cache.put, LLMCache.make_key(
+                            provider, candidate, system, prompt, temperature, max_tokens), text)
+                    return text
+                finally:
+                    slots.release()
+                if last_error.model_unavailable:
+                    self._mark_dead(provider, candidate, last_error)
+                    break
+                if not last_error.retryable or attempt == self.max_retries:
+                    raise last_error
+                await asyncio.sleep(self._backoff_delay(attempt))
+        raise last_error
+
+
+# Process-wide gateway, shared by every module that imports this one
+default_gateway = LLMGateway(
+    cache=LLMCache(os.getenv("LLM_CACHE_DIR", ".llm_cache")),
+    async_queue_timeout=float(os.getenv("LLM_ASYNC_QUEUE_TIMEOUT", "0")) or None,
+)
+
+
+def complete(prompt, **kwargs):
+    """Run a completion through the default gateway; see LLMGateway.complete."""
+    return default_gateway.complete(prompt, **kwargs)
@@ -1,58 +1,112 @@
-from groq import Groq
+import startup  # imported first: starts the startup clock
 import datetime
 import json
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
 import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from search_index import InvertedIndex, entry_fields, has_operators
+from vector_index import VectorIndex
+from journal_analytics import JournalAnalytics
+from journal_stats import JournalStats
+from pattern_analysis import PatternAnalyzer
+from llm_gateway import GroqProvider, default_gateway
+from dream_classifier import default_classifier
+from dream_journal import DEDUP_MODE, dedup_index_path
+from journal_store import open_store
+from dedup import NearDuplicateIndex, entry_text
 
 # Load environment variables
 load_dotenv()
 
+# Shared deadline (seconds) for the analysis/tag/mood calls of one entry
+ENRICHMENT_TIMEOUT = float(os.getenv("ENRICHMENT_TIMEOUT", "30"))
+
+# Worker threads for concurrent enrichment calls
+_enrichment_pool = ThreadPoolExecutor(max_workers=6, thread_name_prefix="enrich")
+
+# Local mood/tag guesses at or above this confidence skip the LLM call
+LOCAL_CONFIDENCE = float(os.getenv("LOCAL_CLASSIFIER_CONFIDENCE", "0.6"))
+
+# Model for new entries unless GROQ_MODEL (or the model argument) says otherwise
+DEFAULT_MODEL = "llama3-70b-8192"
+
+# Tried in order when the selected model is unavailable
+FALLBACK_MODELS = ["llama3-70b-8192"]
+
 class DreamJournalAI:
-    def _init_(self, api_key: str = None):
+    # Built by load_journal() the first time one of them is used
+    _JOURNAL_ATTRS = frozenset({"journal_store", "journal_entries", "search_index", "vector_index", "stats",
+                                "pattern_analyzer", "dedup_index"})
+
+    def __init__(self, api_key: str = None, model: str = None):
         """
         Initialize the Dream Journal AI with Groq API key.
-        
+
+        Nothing here blocks: the model comes from config, and the journal and
+        its indexes are loaded on first use.
+
         Args:
             api_key: Groq API key (optional, will use .env if not provided)
+            model: Groq model id (optional, defaults to $GROQ_MODEL or DEFAULT_MODEL)
         """
         api_key = api_key or os.getenv("GROQ_API_KEY")
         if not api_key:
             raise ValueError("No API key provided. Set GROQ_API_KEY in .env file or pass directly.")
         
-        self.client = Groq(api_key=api_key)
-        self.available_models = {
-            "1": {"name": "Llama 3 70B", "id": "llama3-70b-8192"},
-            "2": {"name": "Llama 3 8B", "id": "llama3-8b-8192"}
-        }
-        self.model = self.select_model()
-        self.journal_entries = []
-        self.load_journal()
-        
-    def select_model(self) -> str:
-        """Let user select from available models"""
-        print("\nAvailable Models:")
-        for key, model in self.available_models.items():
-            print(f"{key}. {model['name']}")
+        # Shared gateway: client reuse, rate limits, retries and response cache
+        self.gateway = default_gateway
+        if not self.gateway.has_provider("groq"):
+            self.gateway.register(GroqProvider(api_key=api_key))
+        self.model = model or os.getenv("GROQ_MODEL") or DEFAULT_MODEL
+
+    def __getattr__(self, name: str):
+        # Only called for attributes that don't exist yet
+        if name in DreamJournalAI._JOURNAL_ATTRS:
+            self.load_journal()
+            return self.__dict__[name]
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
         
-        while True:
-            choice = input("Select model (1-2): ")
-            if choice in self.available_models:
-                return self.available_models[choice]["id"]
-            print("Invalid choice. Please try again.")
-            
     def save_journal(self) -> None:
-        """Save journal entries to a JSON file."""
-        with open('dream_journal.json', 'w') as f:
-            json.dump(self.journal_entries, f, indent=2)
+        """Fold the journal's append-only log into its snapshot (entries are saved as they're recorded)."""
+        self.journal_store.compact()
             
     def load_journal(self) -> None:
-        """Load journal entries from a JSON file if it exists."""
-        try:
-            with open('dream_journal.json', 'r') as f:
-                self.journal_entries = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.journal_entries = []
+        """
+        Load journal entries through the same store as the web app.
+
+        Reads the snapshot plus its append-only log, so saves made by the web
+        app that haven't been compacted yet are included.
+        """
+        self.journal_store = open_store('dream_journal.json')
+        self.journal_entries = self.journal_store.load()
+        self.build_search_index()
+        self.stats = JournalStats('dream_journal.stats.json')
+        self.stats.load(self.journal_entries)
+        self.pattern_analyzer = PatternAnalyzer(
+            lambda prompt, system_msg, max_tokens: self.safe_api_call(
+                prompt=prompt, system_msg=system_msg, max_tokens=max_tokens),
+            path='dream_patterns.json'
+        )
+
+    def build_search_index(self) -> None:
+        """Index every journal entry for local full-text and similarity search."""
+        self.search_index = InvertedIndex()
+        for position, entry in enumerate(self.journal_entries):
+            self.search_index.add(position, entry_fields(entry))
+
+        # The vector file persists between runs; only embed new or rewritten entries.
+        self.vector_index = VectorIndex('dream_vectors.npy')
+        self.vector_index.sync([self._similarity_text(entry) for entry in self.journal_entries])
+
+        # MinHash signatures, persisted in the same file the web app uses;
+        # catches resubmitted dreams
+        self.dedup_index = NearDuplicateIndex(dedup_index_path('dream_journal.json'))
+        self.dedup_index.sync([entry_text(entry) for entry in self.journal_entries])
+
+    @staticmethod
+    def _similarity_text(entry: Dict) -> str:
+        return f"{entry.get('dream', entry.get('text', ''))} {' '.join(entry.get('tags', []))}"
     
     def record_dream(self, dream_description: str) -> Dict:
         """
@@ -62,19 +116,54 @@ class DreamJournalAI:
             dream_description: User's description of their dream
             
         Returns:
-            Dictionary containing the journal entry
+            Dictionary containing the journal entry. If the dream nearly
+            duplicates an earlier one, duplicate_of holds that entry's 1-based
+            id: with DEDUP_MODE "merge" the earlier entry is returned (merged
+            set) and nothing is saved, with "link" the new entry reuses its
+            analysis.
         """
         timestamp = datetime.datetime.now().isoformat()
-        
-        try:
-            analysis = self.analyze_dream(dream_description)
-            tags = self.extract_tags(dream_description)
-            mood = self.detect_mood(dream_description)
-        except Exception as e:
-            print(f"Analysis error: {str(e)}")
-            analysis = "Could not analyze - try again later"
-            tags = ["unprocessed"]
-            mood = "unknown"
+
+        match = self.dedup_index.best(dream_description) if DEDUP_MODE != "off" else None
+        if match is not None:
+            original = self.journal_entries[match[0]]
+            if DEDUP_MODE == "merge":
+                return dict(original, duplicate_of=match[0] + 1, merged=True)
+            return self._save_entry({
+                'timestamp': timestamp,
+                'dream': dream_description,
+                'analysis': original.get('analysis', ''),
+                'tags': original.get('tags', []),
+                'mood': original.get('mood', 'unknown'),
+                'model_used': original.get('model_used', self.model),
+                'duplicate_of': match[0] + 1
+            })
+
+        # The three calls are independent: run them concurrently under one
+        # deadline and keep whichever results come back.
+        fallbacks = {
+            'analysis': "Could not analyze - try again later",
+            'tags': ["unprocessed"],
+            'mood': "unknown",
+        }
+        futures = {
+            'analysis': _enrichment_pool.submit(self.analyze_dream, dream_description),
+            'tags': _enrichment_pool.submit(self.extract_tags, dream_description),
+            'mood': _enrichment_pool.submit(self.detect_mood, dream_description),
+        }
+        wait(futures.values(), timeout=ENRICHMENT_TIMEOUT)
+        results = {}
+        for field, future in futures.items():
+            if not future.done():
+                future.cancel()
+                print(f"Analysis error ({field}): timed out after {ENRICHMENT_TIMEOUT:g}s")
+                results[field] = fallbacks[field]
+            elif future.exception() is not None:
+                print(f"Analysis error ({field}): {future.exception()}")
+                results[field] = fallbacks[field]
+            else:
+                results[field] = future.result()
+        analysis, tags, mood = results['analysis'], results['tags'], results['mood']
 
         entry = {
             'timestamp': timestamp,
@@ -84,30 +173,40 @@ class DreamJournalAI:
             'mood': mood,
             'model_used': self.model
         }
-        
+        return self._save_entry(entry)
+
+    def _save_entry(self, entry: Dict) -> Dict:
+        """Append an entry to the journal, its indexes and its statistics."""
+        self.journal_store.append(entry)
         self.journal_entries.append(entry)
-        self.save_journal()
+        self.search_index.add(len(self.journal_entries) - 1, entry_fields(entry))
+        self.vector_index.add(self._similarity_text(entry))
+        self.dedup_index.add(entry['dream'])
+        self.stats.add(entry)
+        self.stats.save()
         return entry
     
-    def safe_api_call(self, prompt: str, system_msg: str, max_tokens: int = 500, temperature: float = 0.7) -> str:
-        """Handle API calls with error recovery"""
+    def safe_api_call(self, prompt: str, system_msg: str, max_tokens: int = 500, temperature: float = 0.7,
+                      use_cache: bool = True) -> str:
+        """Handle API calls with error recovery, reusing cached responses unless use_cache is False"""
+        models = [self.model] + [m for m in FALLBACK_MODELS if m != self.model]
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_msg},
-                    {"role": "user", "content": prompt}
-                ],
+            return self.gateway.complete(
+                prompt,
+                system=system_msg,
+                provider="groq",
+                models=models,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                use_cache=use_cache
             )
-            return response.choices[0].message.content.strip()
         except Exception as e:
-            if "model_decommissioned" in str(e):
-                print("Model unavailable. Falling back to Llama 3 70B")
-                self.model = "llama3-70b-8192"
-                return self.safe_api_call(prompt, system_msg, max_tokens, temperature)
             raise RuntimeError(f"API Error: {str(e)}")
+        finally:
+            available = self.gateway.first_available("groq", models)
+            if available and available != self.model:
+                print(f"Model unavailable. Falling back to {available}")
+                self.model = available
     
     def analyze_dream(self, dream_text: str) -> str:
         """
@@ -135,6 +234,9 @@ Analysis:"""
     def extract_tags(self, dream_text: str) -> List[str]:
         """
         Extract relevant tags from a dream description.
+
+        Uses the local keyword extractor, asking the LLM only when its
+        confidence is below LOCAL_CONFIDENCE.
         
         Args:
             dream_text: Description of the dream
@@ -142,6 +244,10 @@ Analysis:"""
         Returns:
             List of tags
         """
+        tags, confidence = default_classifier.tags(dream_text)
+        if tags and confidence >= LOCAL_CONFIDENCE:
+            return tags
+
         prompt = f"""Extract 3-5 most relevant tags from this dream description. 
 Return only a comma-separated list of lowercase tags.
 
@@ -162,6 +268,9 @@ Tags:"""
     def detect_mood(self, dream_text: str) -> str:
         """
         Detect the predominant mood of a dream.
+
+        Uses the local lexicon classifier, asking the LLM only when its
+        confidence is below LOCAL_CONFIDENCE.
         
         Args:
             dream_text: Description of the dream
@@ -169,6 +278,10 @@ Tags:"""
         Returns:
             Detected mood (e.g., "happy", "anxious", "neutral")
         """
+        mood, confidence = default_classifier.mood(dream_text)
+        if confidence >= LOCAL_CONFIDENCE:
+            return mood
+
         prompt = f"""Classify the mood of this dream using one word from:
 happy, anxious, fearful, exciting, sad, confusing, neutral, or other.
 
@@ -183,112 +296,142 @@ Mood:"""
             temperature=0.2
         ).lower()
     
-    def search_journal(self, query: str, num_results: int = 5) -> List[Dict]:
+    def search_journal(self, query: str, num_results: int = 5, rerank: bool = False) -> List[Dict]:
         """
         Search through past journal entries for relevant dreams.
-        
+
+        Entries are ranked locally by fusing BM25 keyword hits (over dream
+        text, analysis and tags) with semantic similarity hits, so dreams that
+        share meaning but not words are still found. Use ``word*`` for prefix
+        matches and quotes for phrases; such queries are matched by keyword
+        only, since semantic hits can't honour them.
+
         Args:
             query: Search query
             num_results: Number of results to return
-            
+            rerank: Ask the LLM to re-order the top local hits
+
         Returns:
             List of matching journal entries
         """
         if not self.journal_entries:
             return []
-            
-        try:
-            prompt = f"""Find {num_results} journal entries most relevant to: "{query}".
-Consider dream content, analysis, tags, and mood.
 
-Entries: {json.dumps(self.journal_entries[-50:])}  # Search most recent 50
+        pool_size = max(num_results, 20) if rerank else num_results
+        # Reciprocal rank fusion of the keyword and semantic rankings
+        rankings = [self.search_index.search(query, k=pool_size)]
+        if not has_operators(query):
+            rankings.append(self.vector_index.search(query, k=pool_size))
+        fused = {}
+        for ranking in rankings:
+            for rank, (doc_id, _) in enumerate(ranking):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (60 + rank)
+        ranked = sorted(fused, key=fused.get, reverse=True)[:pool_size]
+        hits = [self.journal_entries[doc_id] for doc_id in ranked]
+        if rerank and len(hits) > 1:
+            hits = self.rerank_results(query, hits)
+        return hits[:num_results]
 
-Return JSON with keys: timestamp, dream_preview, analysis_preview, mood, tags"""
-            
+    def rerank_results(self, query: str, candidates: List[Dict]) -> List[Dict]:
+        """
+        Re-order local search hits by LLM-judged relevance.
+
+        Args:
+            query: Search query
+            candidates: Entries from the local index, best first
+
+        Returns:
+            The same entries re-ordered; the local order is kept on any failure
+        """
+        listing = "\n".join(
+            f"{i}. {entry.get('dream', entry.get('text', ''))[:300]} "
+            f"(mood: {entry.get('mood', 'unknown')}, tags: {', '.join(entry.get('tags', []))})"
+            for i, entry in enumerate(candidates)
+        )
+        prompt = f"""Rank these dream journal entries by relevance to: "{query}".
+
+Entries:
+{listing}
+
+Return only a JSON list of entry numbers, most relevant first."""
+
+        try:
             response = self.safe_api_call(
                 prompt=prompt,
-                system_msg="You search dream journals and return JSON results.",
-                max_tokens=1000,
-                temperature=0.4
+                system_msg="You rank dream journal search results and return JSON.",
+                max_tokens=200,
+                temperature=0.0
             )
-            
-            return json.loads(response)
-        except:
-            # Fallback to simple search
-            query_lower = query.lower()
-            return [
-                entry for entry in self.journal_entries[-50:] 
-                if query_lower in entry['dream'].lower() or 
-                   query_lower in entry['analysis'].lower() or
-                   any(query_lower in tag for tag in entry['tags'])
-            ][:num_results]
-    
+            order = [i for i in json.loads(response) if isinstance(i, int) and 0 <= i < len(candidates)]
+        except Exception:
+            return candidates
+        ranked = list(dict.fromkeys(order))
+        ranked += [i for i in range(len(candidates)) if i not in ranked]
+        return [candidates[i] for i in ranked]
+
+    def find_similar_dreams(self, entry_index: int, num_results: int = 5) -> List[Dict]:
+        """
+        Find the dreams most similar in meaning to a given journal entry.
+
+        Runs entirely on the local vector index, without an LLM call.
+
+        Args:
+            entry_index: Position of the reference entry in the journal (0-based)
+            num_results: Number of results to return
+
+        Returns:
+            List of similar journal entries, most similar first
+        """
+        return [self.journal_entries[row]
+                for row, _ in self.vector_index.similar_to(entry_index, num_results)]
+
     def identify_patterns(self) -> str:
         """
         Analyze all journal entries to identify recurring patterns.
-        
+
+        Windows of entries are summarized once and cached, so each call only
+        sends entries recorded since the previous run plus compact summaries.
+
         Returns:
             Analysis text
         """
-        if not self.journal_entries:
-            return "No journal entries available for analysis."
-            
-        prompt = f"""Analyze these dream journal entries for recurring patterns.
-Identify 3-5 key insights about themes, symbols, or emotional trends.
-
-Journal Entries: {json.dumps(self.journal_entries)}
-
-Key Insights:"""
-        
-        return self.safe_api_call(
-            prompt=prompt,
-            system_msg="You identify patterns in dream journals.",
-            max_tokens=1000
-        )
+        return self.pattern_analyzer.analyze(self.journal_entries)
 
-    def get_statistics(self) -> Dict:
+    def get_statistics(self, since: Optional[str] = None, until: Optional[str] = None) -> Dict:
         """
         Generate statistics about the dream journal.
-        
+
+        Whole-journal totals come from running aggregates kept up to date by
+        record_dream; a date range is answered from the columnar rollups in
+        JournalAnalytics.
+
+        Args:
+            since: First day included (YYYY-MM-DD)
+            until: First day excluded (YYYY-MM-DD)
+
         Returns:
             Dictionary containing statistics
         """
-        stats = {
-            "total_dreams": len(self.journal_entries),
-            "most_common_tags": {},
-            "mood_distribution": {},
-            "dream_frequency": {},
-            "models_used": {}
-        }
-        
-        if not self.journal_entries:
-            return stats
-        
-        # Tag statistics
-        tag_counts = {}
-        for entry in self.journal_entries:
-            for tag in entry.get('tags', []):
-                tag_counts[tag] = tag_counts.get(tag, 0) + 1
-        stats["most_common_tags"] = dict(sorted(tag_counts.items(), 
-                                             key=lambda x: x[1], 
-                                             reverse=True)[:5])
-        
-        # Mood statistics
-        for entry in self.journal_entries:
-            mood = entry.get('mood', 'unknown')
-            stats["mood_distribution"][mood] = stats["mood_distribution"].get(mood, 0) + 1
-        
-        # Model usage
-        for entry in self.journal_entries:
-            model = entry.get('model_used', 'unknown')
-            stats["models_used"][model] = stats["models_used"].get(model, 0) + 1
-        
-        # Date frequency
-        for entry in self.journal_entries:
-            date = entry['timestamp'][:10]  # YYYY-MM-DD
-            stats["dream_frequency"][date] = stats["dream_frequency"].get(date, 0) + 1
-        
-        return stats
+        if since or until:
+            return self.get_analytics().summary(since, until)
+        if not self.stats.matches(self.journal_entries):
+            self.stats.rebuild(self.journal_entries)
+            self.stats.save()
+        return self.stats.summary()
+
+    def get_analytics(self) -> JournalAnalytics:
+        """
+        Return the columnar analytics snapshot, rebuilding it after new entries.
+
+        Returns:
+            JournalAnalytics for the current journal
+        """
+        key = (len(self.journal_entries),
+               self.journal_entries[-1].get('timestamp') if self.journal_entries else None)
+        if getattr(self, '_analytics_key', None) != key:
+            self._analytics = JournalAnalytics(self.journal_entries)
+            self._analytics_key = key
+        return self._analytics
 
 
 def main():
@@ -296,7 +439,13 @@ def main():
         print("\n🌙 Dream Journal AI 🌙")
         print("Type 'quit' anytime to exit\n")
         
+        profile = startup.StartupProfile()
+        profile.mark("imports")
         journal = DreamJournalAI()
+        profile.ready("init")
+        if os.getenv("STARTUP_PROFILE", "0") == "1":
+            print(f"INFO: {profile.report()}")
+        print(f"Model: {journal.model} (set GROQ_MODEL to change)\n")
         
         while True:
             action = input(
@@ -305,6 +454,7 @@ def main():
                 "2. Search journal\n"
                 "3. View statistics\n"
                 "4. Identify patterns\n"
+                "5. Find similar dreams\n"
                 "> "
             ).lower()
             
@@ -318,7 +468,13 @@ def main():
                         break
                     if dream.strip():
                         entry = journal.record_dream(dream)
-                        print("\n✨ Dream recorded! ✨")
+                        if entry.get('merged'):
+                            print(f"\nThis looks like dream #{entry['duplicate_of']}, "
+                                  "which is already in your journal.")
+                        elif entry.get('duplicate_of'):
+                            print(f"\n✨ Dream recorded! ✨ (similar to dream #{entry['duplicate_of']})")
+                        else:
+                            print("\n✨ Dream recorded! ✨")
                         print(f"\nAnalysis: {entry['analysis']}")
                         print(f"Mood: {entry['mood'].capitalize()}")
                         print(f"Tags: {', '.join(entry['tags'])}")
@@ -362,8 +518,29 @@ def main():
                 print("\nPatterns Found:")
                 print(patterns)
                 
+            elif action == '5':
+                total = len(journal.journal_entries)
+                if not total:
+                    print("\nNo dreams recorded yet.")
+                    continue
+                choice = input(f"\nEntry number (1-{total}, Enter for latest): ").strip()
+                if not choice:
+                    index = total - 1
+                elif choice.isdigit() and 1 <= int(choice) <= total:
+                    index = int(choice) - 1
+                else:
+                    print("Invalid entry number.")
+                    continue
+
+                results = journal.find_similar_dreams(index)
+                print(f"\nDreams similar to #{index + 1}:")
+                for i, result in enumerate(results, 1):
+                    print(f"\n{i}. {result.get('timestamp', 'No date')[:10]}")
+                    print(f"Preview: {result.get('dream', 'No content')[:150]}...")
+                    print(f"Mood: {result.get('mood', 'unknown').capitalize()}")
+
             else:
-                print("Invalid option. Please choose 1-4.")
+                print("Invalid option. Please choose 1-5.")
             
             print("\n" + "="*50 + "\n")
             
@@ -373,5 +550,5 @@ def main():
         print("\nJournal saved. Sweet dreams! 🌙")
 
 
-if _name_ == "_main_":
-    main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file
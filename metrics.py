@@ -0,0 +1,205 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+# Latency buckets (seconds): sub-millisecond journal hits up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, one series per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labels, stage=None):
+        """Context manager observing the block's duration (and recording it as a stage)."""
+        return _Timer(self, labels, stage)
+
+    def render(self):
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(values[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "stage", "started")
+
+    def __init__(self, histogram, labels, stage):
+        self.histogram = histogram
+        self.labels = labels
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        self.histogram.observe(elapsed, *self.labels)
+        if self.stage:
+            record_stage(self.stage, elapsed)
+        return False
+
+
+class Registry:
+    """Metrics plus collectors that report values owned by other objects at scrape time."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect):
+        """
+        Add a callable returning [(name, type, help, [(labels dict, value), ...]), ...].
+
+        Collectors read counters that already exist (cache stats, queue depth),
+        so they cost nothing until /metrics is scraped.
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, kind, help, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "dreamweaver_http_request_duration_seconds", "Time to produce a response, by route.",
+    ("route", "method", "status"))
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "dreamweaver_llm_request_duration_seconds", "Upstream LLM call duration, by model and outcome.",
+    ("provider", "model", "outcome"))
+LLM_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "dreamweaver_llm_first_token_seconds", "Time to the first streamed chunk of an LLM call.",
+    ("provider", "model"))
+LLM_TOKENS = REGISTRY.counter(
+    "dreamweaver_llm_tokens_total", "Prompt and response tokens (API-reported, else estimated).",
+    ("provider", "model", "kind"))
+LLM_ERRORS = REGISTRY.counter(
+    "dreamweaver_llm_errors_total", "Failed upstream LLM calls, by HTTP status.",
+    ("provider", "model", "status"))
+JOURNAL_SECONDS = REGISTRY.histogram(
+    "dreamweaver_journal_operation_duration_seconds", "Journal storage read and write timings.",
+    ("operation",))
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) for APIs that don't report usage."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+# ---------- per-request timing breakdown (Server-Timing) ----------
+
+_stages = contextvars.ContextVar("metrics_stages", default=None)
+
+
+def start_request():
+    """Begin collecting stage timings for the current request."""
+    _stages.set([])
+
+
+def record_stage(name, seconds):
+    stages = _stages.get()
+    if stages is not None:
+        stages.append((name, seconds))
+
+
+def finish_request(total=None):
+    """Return the Server-Timing header value for the request and stop collecting."""
+    stages = _stages.get() or []
+    _stages.set(None)
+    totals = {}
+    for name, seconds in stages:
+        totals[name] = totals.get(name, 0.0) + seconds
+    if total is not None:
+        totals["total"] = total
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
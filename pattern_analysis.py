@@ -0,0 +1,148 @@
+import json
+from typing import Callable, Dict, List
+
+from journal_store import write_json_atomic
+
+
+def _compact_entry(entry: Dict) -> str:
+    """One-line form of an entry for summarization prompts."""
+    dream = (entry.get('dream') or entry.get('text') or '').replace('\n', ' ')[:400]
+    return (f"[{entry.get('timestamp', '')[:10]}] ({entry.get('mood', 'unknown')}; "
+            f"{', '.join(entry.get('tags', []))}) {dream}")
+
+
+class PatternAnalyzer:
+    """
+    Hierarchical (map-reduce) pattern analysis over the dream journal.
+
+    Fixed-size windows of entries are summarized once and cached on disk.
+    Every few windows are merged into a period summary, which is folded into
+    a rolling history summary. Each call therefore only summarizes entries
+    added since the last run, and the final prompt stays roughly constant in
+    size however long the journal grows.
+    """
+
+    def __init__(self, complete: Callable[..., str], path: str = "dream_patterns.json",
+                 window_size: int = 20, windows_per_period: int = 5):
+        """
+        Args:
+            complete: Callable taking (prompt, system_msg, max_tokens) and returning text
+            path: File the summaries are cached in
+            window_size: Entries per window summary
+            windows_per_period: Window summaries merged into each period summary
+        """
+        self.complete = complete
+        self.path = path
+        self.window_size = window_size
+        self.windows_per_period = windows_per_period
+        self.state = self._load()
+
+    def _empty_state(self) -> Dict:
+        return {
+            "window_size": self.window_size,
+            "windows_done": 0,
+            "last_timestamp": None,
+            "pending_windows": [],
+            "periods": [],
+            "history": "",
+            "insights": None,
+            "insights_for": None,
+        }
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            if state.get("window_size") == self.window_size:
+                return state
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return self._empty_state()
+
+    def _save(self) -> None:
+        write_json_atomic(self.path, self.state, indent=None)
+
+    def _still_valid(self, entries: List[Dict]) -> bool:
+        covered = self.state["windows_done"] * self.window_size
+        if covered > len(entries):
+            return False
+        return covered == 0 or entries[covered - 1].get('timestamp') == self.state["last_timestamp"]
+
+    def _summarize_window(self, window: List[Dict]) -> str:
+        listing = "\n".join(_compact_entry(entry) for entry in window)
+        prompt = f"""Summarize the recurring themes, symbols, emotions and moods in these dream journal entries.
+Be concise (at most 6 bullet points) and mention dates where a theme starts or stops.
+
+Entries:
+{listing}
+
+Summary:"""
+        return self.complete(prompt, "You summarize dream journals.", 300)
+
+    def _merge(self, summaries: List[str], what: str) -> str:
+        joined = "\n\n".join(f"Part {i}:\n{summary}" for i, summary in enumerate(summaries, 1))
+        prompt = f"""Merge these consecutive dream journal summaries into one {what}.
+Keep recurring themes, note how moods and symbols change over time, and stay under 200 words.
+
+{joined}
+
+Merged summary:"""
+        return self.complete(prompt, "You summarize dream journals.", 400)
+
+    def analyze(self, entries: List[Dict]) -> str:
+        """
+        Identify recurring patterns, summarizing only entries new since the last call.
+
+        Args:
+            entries: The full journal, oldest first
+
+        Returns:
+            Insights text
+        """
+        if not entries:
+            return "No journal entries available for analysis."
+        if not self._still_valid(entries):
+            self.state = self._empty_state()
+        marker = [len(entries), entries[-1].get('timestamp')]
+        if self.state["insights_for"] == marker and self.state["insights"]:
+            return self.state["insights"]
+
+        # Map: summarize each newly completed window once
+        size = self.window_size
+        while (self.state["windows_done"] + 1) * size <= len(entries):
+            start = self.state["windows_done"] * size
+            window = entries[start:start + size]
+            self.state["pending_windows"].append(self._summarize_window(window))
+            self.state["windows_done"] += 1
+            self.state["last_timestamp"] = window[-1].get('timestamp')
+
+            # Reduce: fold full periods into the rolling history
+            if len(self.state["pending_windows"]) >= self.windows_per_period:
+                period = self._merge(self.state["pending_windows"], "period summary")
+                self.state["periods"].append(period)
+                self.state["pending_windows"] = []
+                history = self.state["history"]
+                self.state["history"] = self._merge([history, period], "overall history") if history else period
+            self._save()
+
+        tail = entries[self.state["windows_done"] * size:]
+        sections = []
+        if self.state["history"]:
+            sections.append(f"Earlier history:\n{self.state['history']}")
+        for i, summary in enumerate(self.state["pending_windows"], 1):
+            sections.append(f"Recent period {i}:\n{summary}")
+        if tail:
+            sections.append("Latest entries:\n" + "\n".join(_compact_entry(entry) for entry in tail))
+
+        body = "\n\n".join(sections)
+        prompt = f"""Analyze this dream journal for recurring patterns.
+Identify 3-5 key insights about themes, symbols, or emotional trends.
+
+{body}
+
+Key Insights:"""
+        insights = self.complete(prompt, "You identify patterns in dream journals.", 1000)
+        self.state["insights"] = insights
+        self.state["insights_for"] = marker
+        self._save()
+        return insights
@@ -0,0 +1,147 @@
+import bisect
+import heapq
+import math
+import re
+from typing import Dict, Iterable, List, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+# Gap inserted between fields so phrases never match across field boundaries
+FIELD_GAP = 50
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into word tokens."""
+    return TOKEN_RE.findall(text.lower())
+
+
+def has_operators(query: str) -> bool:
+    """True if the query uses a quoted phrase or a ``term*`` prefix."""
+    return any(phrase or word.endswith("*") for phrase, word in QUERY_RE.findall(query))
+
+
+def entry_fields(entry: Dict) -> List[str]:
+    """Return the searchable fields of a journal entry: dream text, analysis, tags."""
+    return [
+        entry.get("dream") or entry.get("text") or "",
+        entry.get("analysis") or "",
+        " ".join(entry.get("tags") or []),
+    ]
+
+
+class InvertedIndex:
+    """
+    Positional inverted index over journal entries with BM25 ranking.
+
+    Supports plain terms, prefix terms (``fly*``) and quoted phrases
+    (``"falling down"``). Entries are added incrementally as they are recorded.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, List[int]]] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        self.total_length = 0
+        # Sorted vocabulary for prefix lookups
+        self.terms: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, doc_id: int, fields: Iterable[str]) -> None:
+        """
+        Index a document.
+
+        Args:
+            doc_id: Identifier returned by search (the entry's journal position)
+            fields: Text fields to index
+        """
+        position = 0
+        length = 0
+        for field in fields:
+            for token in tokenize(field):
+                doc_postings = self.postings.get(token)
+                if doc_postings is None:
+                    doc_postings = self.postings[token] = {}
+                    bisect.insort(self.terms, token)
+                doc_postings.setdefault(doc_id, []).append(position)
+                position += 1
+                length += 1
+            position += FIELD_GAP
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[int, float]]:
+        """
+        Rank documents against a query with BM25.
+
+        Args:
+            query: Search query; ``term*`` matches by prefix, ``"a b"`` matches a phrase
+            k: Number of results to return
+
+        Returns:
+            List of (doc_id, score) pairs, best first
+        """
+        if not self.doc_lengths:
+            return []
+        scores: Dict[int, float] = {}
+        required = None  # docs that satisfy every phrase in the query
+
+        for phrase, word in QUERY_RE.findall(query):
+            if phrase:
+                tokens = tokenize(phrase)
+                if not tokens:
+                    continue
+                matches = self._phrase_docs(tokens)
+                required = matches if required is None else required & matches
+                for token in tokens:
+                    self._score_term(token, scores, restrict=matches)
+            else:
+                tokens = tokenize(word)
+                for i, token in enumerate(tokens):
+                    if word.endswith("*") and i == len(tokens) - 1:
+                        for term in self._expand_prefix(token):
+                            self._score_term(term, scores)
+                    else:
+                        self._score_term(token, scores)
+
+        if required is not None:
+            scores = {doc_id: s for doc_id, s in scores.items() if doc_id in required}
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + "\uffff")
+        return self.terms[start:end]
+
+    def _score_term(self, term: str, scores: Dict[int, float], restrict=None) -> None:
+        doc_postings = self.postings.get(term)
+        if not doc_postings:
+            return
+        n_docs = len(self.doc_lengths)
+        idf = math.log(1 + (n_docs - len(doc_postings) + 0.5) / (len(doc_postings) + 0.5))
+        avg_length = self.total_length / n_docs or 1
+        for doc_id, positions in doc_postings.items():
+            if restrict is not None and doc_id not in restrict:
+                continue
+            tf = len(positions)
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+    def _phrase_docs(self, tokens: List[str]) -> set:
+        postings = [self.postings.get(token) for token in tokens]
+        if not all(postings):
+            return set()
+        candidates = set.intersection(*(set(p) for p in postings))
+        matches = set()
+        for doc_id in candidates:
+            starts = set(postings[0][doc_id])
+            for offset, doc_postings in enumerate(postings[1:], 1):
+                starts &= {pos - offset for pos in doc_postings[doc_id]}
+                if not starts:
+                    break
+            if starts:
+                matches.add(doc_id)
+        return matches
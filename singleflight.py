@@ -0,0 +1,82 @@
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+
+
+def normalize(text):
+    """Case- and whitespace-insensitive form of a prompt, for request keys."""
+    return " ".join(text.split()).casefold()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait on the same future and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    def _join(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        return future, leader
+
+    def do(self, key, fn):
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def do_async(self, key, coro_fn):
+        """Like do(), for coroutine functions; followers await without blocking the loop."""
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await coro_fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        return {
+            "upstream_calls": self.leaders,
+            "upstream_calls_saved": self.followers,
+            "in_flight": len(self._calls),
+        }
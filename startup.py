@@ -0,0 +1,43 @@
+import time
+
+# Entry points import this module before anything else, so the clock
+# includes their own imports
+IMPORTED_AT = time.perf_counter()
+
+
+class StartupProfile:
+    """Wall-clock time from process start to ready, split into named phases."""
+
+    def __init__(self, started=IMPORTED_AT):
+        self.started = started
+        self._last = started
+        self.phases = {}
+        self.ready_at = None
+
+    def mark(self, phase):
+        """Close a phase: everything since the previous mark is charged to it."""
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def ready(self, phase="setup"):
+        self.mark(phase)
+        self.ready_at = self._last
+
+    def summary(self):
+        end = self.ready_at if self.ready_at is not None else self._last
+        return {
+            "total_ms": round((end - self.started) * 1000, 1),
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+            "ready": self.ready_at is not None,
+        }
+
+    def report(self):
+        summary = self.summary()
+        phases = ", ".join(f"{name} {ms}" for name, ms in summary["phases_ms"].items())
+        return f"startup {summary['total_ms']} ms ({phases})"
+
+    def collect(self):
+        """Metrics collector: one gauge sample per phase."""
+        return [("dreamweaver_startup_seconds", "gauge", "Time spent in each startup phase.",
+                 [({"phase": name}, seconds) for name, seconds in self.phases.items()])]
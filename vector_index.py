@@ -0,0 +1,307 @@
+import itertools
+import json
+import os
+import re
+import zlib
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z]+")
+
+# Dream themes whose words rarely overlap literally ("falling" vs "dropping
+# off a cliff"). Words are mapped onto a shared concept feature at embed time.
+CONCEPTS = {
+    "falling": ["fall", "falling", "fell", "drop", "dropping", "plunge", "plummet",
+                "tumble", "cliff", "edge", "slip", "sink"],
+    "flying": ["fly", "flying", "flew", "float", "floating", "soar", "glide", "wings",
+               "sky", "hover", "levitate"],
+    "chase": ["chase", "chased", "chasing", "pursue", "run", "running", "flee", "escape",
+              "hunt", "follow", "hide"],
+    "water": ["water", "ocean", "sea", "river", "lake", "wave", "flood", "swim",
+              "drown", "rain", "beach"],
+    "teeth": ["teeth", "tooth", "mouth", "jaw", "crumble", "dentist"],
+    "death": ["death", "die", "dying", "dead", "funeral", "grave", "ghost", "corpse"],
+    "exam": ["exam", "test", "school", "class", "teacher", "late", "homework", "grade"],
+    "lost": ["lost", "maze", "wander", "search", "confused", "stranger", "unknown"],
+    "home": ["house", "home", "room", "door", "hallway", "stairs", "basement", "attic"],
+    "fire": ["fire", "flame", "burn", "burning", "smoke", "explode", "heat"],
+    "darkness": ["dark", "darkness", "night", "shadow", "black", "void", "abyss"],
+    "animals": ["dog", "cat", "snake", "spider", "wolf", "bird", "horse", "bear",
+                "insect", "animal"],
+    "family": ["mother", "father", "mom", "dad", "sister", "brother", "family",
+               "grandmother", "grandfather", "child", "baby"],
+    "trapped": ["trapped", "stuck", "paralyzed", "frozen", "cage", "locked", "cannot"],
+}
+
+
+def _stem(word: str) -> str:
+    """Very small suffix stripper so falling/falls/fall share features."""
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "lsz":
+                word = word[:-1]
+            break
+    return word
+
+
+CONCEPT_STEMS = {_stem(word): concept for concept, words in CONCEPTS.items() for word in words}
+
+
+def _checksum(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def _bucket(feature: str, dim: int) -> int:
+    # crc32 rather than hash(): Python's str hash is salted per process.
+    return zlib.crc32(feature.encode("utf-8")) % dim
+
+
+def embed(text: str, dim: int = 1024) -> np.ndarray:
+    """
+    Embed text as an L2-normalized hashed bag of stems and dream concepts.
+
+    Args:
+        text: Text to embed
+        dim: Number of hash buckets
+
+    Returns:
+        float32 vector of length dim
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in TOKEN_RE.findall(text.lower()):
+        stem = _stem(token)
+        vector[_bucket(stem, dim)] += 1.0
+        concept = CONCEPT_STEMS.get(stem)
+        if concept:
+            vector[_bucket("concept:" + concept, dim)] += 1.0
+    np.log1p(vector, out=vector)
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+
+class VectorIndex:
+    """
+    Cosine-similarity index over dream embeddings.
+
+    Vectors live in a contiguous float32 matrix memory-mapped from an .npy
+    file; row i holds journal entry i. Queries are scored with matrix
+    products over the whole matrix in fixed-size chunks.
+
+    A CRC32 of each row's text is kept in a side file, so sync() can tell a
+    rewritten entry from an unchanged one.
+    """
+
+    CHUNK_ROWS = 65536
+    # Texts embedded per batch; each batch is written straight into the file
+    EMBED_ROWS = 4096
+
+    def __init__(self, path: str = "dream_vectors.npy", dim: int = 1024):
+        self.path = path
+        self.meta_path = os.path.splitext(path)[0] + ".json"
+        self.checksum_path = os.path.splitext(path)[0] + ".crc"
+        self.dim = dim
+        self.count = 0
+        self.matrix = None
+        self.checksums = np.zeros(0, dtype=np.uint32)
+        self._open()
+        # Document frequency per bucket, used to IDF-weight queries
+        self.df = np.zeros(dim, dtype=np.int64)
+        for start in range(0, self.count, self.CHUNK_ROWS):
+            self.df += (self.matrix[start:min(start + self.CHUNK_ROWS, self.count)] > 0).sum(axis=0)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _open(self) -> None:
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            matrix = np.load(self.path, mmap_mode="r+")
+        except (FileNotFoundError, ValueError, json.JSONDecodeError):
+            self._allocate(1024)
+            return
+        if meta.get("dim") != self.dim or matrix.shape[1] != self.dim:
+            self._allocate(1024)
+            return
+        self.matrix = matrix
+        self.count = min(meta.get("count", 0), matrix.shape[0])
+        try:
+            stored = np.fromfile(self.checksum_path, dtype=np.uint32)[:self.count]
+        except (FileNotFoundError, ValueError):
+            stored = np.zeros(0, dtype=np.uint32)
+        self.checksums = np.zeros(matrix.shape[0], dtype=np.uint32)
+        self.checksums[:len(stored)] = stored
+        # Rows from before checksums were kept can't be trusted by sync()
+        self._verified = len(stored)
+
+    def _allocate(self, capacity: int) -> None:
+        tmp_path = self.path + ".tmp.npy"
+        matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32,
+                                           shape=(capacity, self.dim))
+        if self.matrix is not None and self.count:
+            matrix[:self.count] = self.matrix[:self.count]
+        matrix.flush()
+        del matrix
+        os.replace(tmp_path, self.path)
+        self.matrix = np.load(self.path, mmap_mode="r+")
+        checksums = np.zeros(capacity, dtype=np.uint32)
+        checksums[:self.count] = self.checksums[:self.count]
+        self.checksums = checksums
+        if not self.count:
+            self._verified = 0
+        self._save_meta()
+
+    def _save_meta(self) -> None:
+        with open(self.meta_path, "w") as f:
+            json.dump({"count": self.count, "dim": self.dim}, f)
+
+    def add(self, text: str) -> int:
+        """
+        Embed and append one document.
+
+        Args:
+            text: Text to embed
+
+        Returns:
+            Row index of the new vector
+        """
+        return self.add_many([text])[0]
+
+    def add_many(self, texts: Iterable[str]) -> List[int]:
+        """Embed and append several documents, EMBED_ROWS at a time."""
+        start = self.count
+        texts = iter(texts)
+        while True:
+            chunk = list(itertools.islice(texts, self.EMBED_ROWS))
+            if not chunk:
+                break
+            needed = self.count + len(chunk)
+            if needed > self.matrix.shape[0]:
+                capacity = self.matrix.shape[0]
+                while capacity < needed:
+                    capacity *= 2
+                self._allocate(capacity)
+            self._embed_rows(self.count, chunk)
+            self.count = needed
+        if self.count == start:
+            return []
+        self.matrix.flush()
+        with open(self.checksum_path, "ab") as f:
+            f.truncate(start * 4)  # drop rows left over from an interrupted write
+            f.write(self.checksums[start:self.count].tobytes())
+        if self._verified == start:
+            self._verified = self.count
+        self._save_meta()
+        return list(range(start, self.count))
+
+    def sync(self, texts: Sequence[str]) -> None:
+        """
+        Make the index cover exactly texts (row i = texts[i]): rows whose text
+        changed are re-embedded in place, extra rows dropped, missing ones added.
+        """
+        if self._verified < self.count:
+            self._truncate(self._verified)
+        if len(texts) < self.count:
+            self._truncate(len(texts))
+        checksums = np.fromiter((_checksum(text) for text in texts[:self.count]),
+                                np.uint32, self.count)
+        changed = np.flatnonzero(checksums != self.checksums[:self.count])
+        for row in changed:
+            self.df -= self.matrix[row] > 0
+            self._embed_rows(int(row), [texts[row]])
+        if len(changed):
+            self.matrix.flush()
+            self._write_checksums()
+        self.add_many(texts[self.count:])
+
+    def reset(self) -> None:
+        """Drop all vectors."""
+        self._truncate(0)
+
+    def _embed_rows(self, row: int, texts: List[str]) -> None:
+        block = self.matrix[row:row + len(texts)]
+        for i, text in enumerate(texts):
+            block[i] = embed(text, self.dim)
+        self.df += (block > 0).sum(axis=0)
+        self.checksums[row:row + len(texts)] = [_checksum(text) for text in texts]
+
+    def _truncate(self, count: int) -> None:
+        for start in range(count, self.count, self.CHUNK_ROWS):
+            self.df -= (self.matrix[start:min(start + self.CHUNK_ROWS, self.count)] > 0).sum(axis=0)
+        self.count = count
+        self._verified = count
+        self._write_checksums()
+        self._save_meta()
+
+    def _write_checksums(self) -> None:
+        tmp_path = self.checksum_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.checksums[:self.count].tobytes())
+        os.replace(tmp_path, self.checksum_path)
+
+    def _query_vector(self, text: str) -> np.ndarray:
+        idf = np.log((1 + self.count) / (1 + self.df)).astype(np.float32) + 1.0
+        vector = embed(text, self.dim) * idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def search(self, text: str, k: int = 5) -> List[Tuple[int, float]]:
+        """
+        Find the rows most similar to a piece of text.
+
+        Args:
+            text: Query text
+            k: Number of results
+
+        Returns:
+            List of (row, cosine score) pairs, best first
+        """
+        return self.search_batch([text], k)[0]
+
+    def search_batch(self, texts: List[str], k: int = 5) -> List[List[Tuple[int, float]]]:
+        """Answer several queries with one pass over the matrix."""
+        if not texts:
+            return []
+        queries = np.vstack([self._query_vector(text) for text in texts]).T
+        return self._top_k(queries, k)
+
+    def similar_to(self, row: int, k: int = 5) -> List[Tuple[int, float]]:
+        """
+        Find the rows most similar to an existing row, excluding itself.
+
+        Args:
+            row: Row index of the reference entry
+            k: Number of results
+
+        Returns:
+            List of (row, cosine score) pairs, best first
+        """
+        if not 0 <= row < self.count:
+            raise IndexError(f"No vector for entry {row}")
+        query = np.array(self.matrix[row], dtype=np.float32).reshape(-1, 1)
+        hits = self._top_k(query, k + 1)[0]
+        return [(other, score) for other, score in hits if other != row][:k]
+
+    def _top_k(self, queries: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        n_queries = queries.shape[1]
+        if not self.count:
+            return [[] for _ in range(n_queries)]
+        best_rows = np.empty((0, n_queries), dtype=np.int64)
+        best_scores = np.empty((0, n_queries), dtype=np.float32)
+        for start in range(0, self.count, self.CHUNK_ROWS):
+            stop = min(start + self.CHUNK_ROWS, self.count)
+            scores = self.matrix[start:stop] @ queries
+            take = min(k, stop - start)
+            top = np.argpartition(-scores, take - 1, axis=0)[:take]
+            best_rows = np.vstack([best_rows, top + start])
+            best_scores = np.vstack([best_scores, np.take_along_axis(scores, top, axis=0)])
+        results = []
+        for q in range(n_queries):
+            order = np.argsort(-best_scores[:, q])[:k]
+            results.append([(int(best_rows[i, q]), float(best_scores[i, q]))
+                            for i in order if best_scores[i, q] > 0])
+        return results
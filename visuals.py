@@ -0,0 +1,241 @@
+import colorsys
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+
+from singleflight import SingleFlight
+
+# Base hues (degrees), saturation and lightness per mood; web and CLI mood
+# names both map here.
+MOOD_PALETTES = {
+    "happy": (40, 0.85, 0.62),
+    "peaceful": (175, 0.45, 0.60),
+    "excited": (310, 0.90, 0.55),
+    "exciting": (310, 0.90, 0.55),
+    "sad": (215, 0.40, 0.38),
+    "anxious": (55, 0.35, 0.45),
+    "fearful": (355, 0.70, 0.25),
+    "confused": (275, 0.55, 0.45),
+    "confusing": (275, 0.55, 0.45),
+    "neutral": (235, 0.45, 0.35),
+}
+FILENAME_RE = re.compile(r"^[0-9a-f]{32}\.(svg|png|jpg|webp)$")
+CONTENT_TYPES = {"svg": "image/svg+xml", "png": "image/png", "jpg": "image/jpeg",
+                 "webp": "image/webp"}
+
+
+def _hex(hue, saturation, lightness):
+    r, g, b = colorsys.hls_to_rgb((hue % 360) / 360, max(0, min(1, lightness)),
+                                  max(0, min(1, saturation)))
+    return f"#{int(r * 255):02x}{int(g * 255):02x}{int(b * 255):02x}"
+
+
+class ProceduralRenderer:
+    """
+    Render an SVG dreamscape from the prompt alone: a sky gradient in the
+    mood's palette, a glowing orb, stars and layered hills, plus motifs for
+    the dream themes the prompt mentions. The same prompt and mood always
+    give the same image.
+
+    Renderers are the hook for a real image model: anything with `name`,
+    `extension` and `render(prompt, mood, width, height) -> bytes` works.
+    """
+
+    name = "procedural"
+    extension = "svg"
+
+    def render(self, prompt, mood, width=800, height=400):
+        from vector_index import CONCEPT_STEMS, TOKEN_RE, _stem
+
+        seed = hashlib.sha256(f"{prompt}\0{mood}".encode("utf-8")).digest()
+        rng = random.Random(int.from_bytes(seed[:8], "big"))
+        if mood in MOOD_PALETTES:
+            hue, sat, light = MOOD_PALETTES[mood]
+            hue += rng.uniform(-15, 15)
+        else:
+            hue, sat, light = seed[8] * 360 / 256, 0.55, 0.45
+        themes = {CONCEPT_STEMS.get(_stem(t)) for t in TOKEN_RE.findall(prompt.lower())}
+
+        sky_top = _hex(hue + 20, sat, light * 0.45)
+        sky_bottom = _hex(hue - 20, sat * 0.9, min(0.85, light * 1.35))
+        orb = _hex(hue + 180 if "darkness" not in themes else hue, 0.8, 0.85)
+        parts = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}">',
+            '<defs>',
+            f'<linearGradient id="sky" x1="0" y1="0" x2="0" y2="1">'
+            f'<stop offset="0" stop-color="{sky_top}"/><stop offset="1" stop-color="{sky_bottom}"/>'
+            f'</linearGradient>',
+            f'<radialGradient id="glow"><stop offset="0" stop-color="{orb}" stop-opacity="1"/>'
+            f'<stop offset="1" stop-color="{orb}" stop-opacity="0"/></radialGradient>',
+            '</defs>',
+            f'<rect width="{width}" height="{height}" fill="url(#sky)"/>',
+        ]
+
+        for _ in range(int(40 * (1 - light)) + 10):
+            parts.append(f'<circle cx="{rng.uniform(0, width):.1f}" cy="{rng.uniform(0, height * 0.6):.1f}" '
+                         f'r="{rng.uniform(0.5, 1.8):.1f}" fill="#fff" opacity="{rng.uniform(0.3, 0.9):.2f}"/>')
+        ox, oy, radius = rng.uniform(0.15, 0.85) * width, rng.uniform(0.15, 0.4) * height, rng.uniform(30, 60)
+        parts.append(f'<circle cx="{ox:.1f}" cy="{oy:.1f}" r="{radius * 2.5:.1f}" fill="url(#glow)" opacity="0.5"/>')
+        parts.append(f'<circle cx="{ox:.1f}" cy="{oy:.1f}" r="{radius:.1f}" fill="{orb}"/>')
+
+        if "flying" in themes:
+            for _ in range(rng.randint(3, 7)):
+                x, y, s = rng.uniform(0, width), rng.uniform(0.1, 0.5) * height, rng.uniform(6, 14)
+                parts.append(f'<path d="M{x - s:.1f},{y - s / 2:.1f} Q{x - s / 2:.1f},{y - s:.1f} {x:.1f},{y:.1f} '
+                             f'Q{x + s / 2:.1f},{y - s:.1f} {x + s:.1f},{y - s / 2:.1f}" fill="none" '
+                             f'stroke="#111" stroke-width="2" opacity="0.7"/>')
+        if "falling" in themes:
+            for _ in range(rng.randint(8, 16)):
+                x, y = rng.uniform(0, width), rng.uniform(0, height * 0.7)
+                parts.append(f'<line x1="{x:.1f}" y1="{y:.1f}" x2="{x - 6:.1f}" y2="{y + 40:.1f}" '
+                             f'stroke="#fff" stroke-width="1" opacity="0.4"/>')
+
+        # Layered hills (or waves for water dreams), lighter towards the back
+        layers = 3
+        for layer in range(layers):
+            base = height * (0.55 + 0.13 * layer)
+            amplitude = height * (0.05 if "water" in themes else rng.uniform(0.06, 0.14))
+            steps = 8 if "water" in themes else rng.randint(3, 6)
+            points = [f"M0,{height}", f"L0,{base:.1f}"]
+            for i in range(1, steps + 1):
+                x = width * i / steps
+                cx = x - width / steps / 2
+                cy = base + rng.uniform(-amplitude, amplitude) * (2 if i % 2 else -2)
+                points.append(f"Q{cx:.1f},{cy:.1f} {x:.1f},{base + rng.uniform(-amplitude, amplitude):.1f}")
+            points.append(f"L{width},{height} Z")
+            color = _hex(hue - 30 + 25 * layer, sat * 0.8, light * (0.75 - 0.2 * layer))
+            parts.append(f'<path d="{" ".join(points)}" fill="{color}" opacity="{0.85 + 0.05 * layer:.2f}"/>')
+
+        caption = prompt if len(prompt) <= 70 else prompt[:67] + "..."
+        parts.append(f'<text x="{width / 2:.0f}" y="{height - 16}" text-anchor="middle" '
+                     f'font-family="Georgia, serif" font-size="16" fill="#fff" opacity="0.8">'
+                     f'{escape(caption)}</text>')
+        parts.append("</svg>")
+        return "\n".join(parts).encode("utf-8")
+
+
+RENDERERS = {"procedural": ProceduralRenderer}
+
+
+class VisualStore:
+    """Size-bounded disk store of rendered images, evicting the least recently used."""
+
+    def __init__(self, directory=".visual_cache", max_bytes=32 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._files = OrderedDict()  # filename -> size, least recently used first
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._scanned = False  # directory is indexed on first use
+
+    def _scan(self):
+        if self._scanned:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for name in os.listdir(self.directory):
+            if FILENAME_RE.match(name):
+                st = os.stat(os.path.join(self.directory, name))
+                found.append((st.st_mtime, name, st.st_size))
+        with self._lock:
+            if not self._scanned:
+                for _, name, size in sorted(found):
+                    self._files[name] = size
+                    self._bytes += size
+                self._scanned = True
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def touch(self, filename):
+        """Mark a file as used; False if it isn't stored."""
+        self._scan()
+        with self._lock:
+            if filename not in self._files:
+                self.misses += 1
+                return False
+            self._files.move_to_end(filename)
+            self.hits += 1
+        try:
+            os.utime(self.path(filename))
+        except OSError:
+            pass
+        return True
+
+    def read(self, filename):
+        try:
+            with open(self.path(filename), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, filename, data):
+        self._scan()
+        tmp_path = self.path(filename) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(filename))
+        evicted = []
+        with self._lock:
+            self._bytes += len(data) - self._files.pop(filename, 0)
+            self._files[filename] = len(data)
+            while self._bytes > self.max_bytes and len(self._files) > 1:
+                old, size = self._files.popitem(last=False)
+                self._bytes -= size
+                evicted.append(old)
+        for old in evicted:
+            try:
+                os.remove(self.path(old))
+            except OSError:
+                pass
+
+    def stats(self):
+        self._scan()
+        return {"hits": self.hits, "misses": self.misses, "items": len(self._files),
+                "bytes": self._bytes}
+
+
+class DreamVisuals:
+    """
+    Content-addressed visuals: the file name is a hash of renderer, prompt,
+    mood and size, so a repeat prompt is a cache hit and its URL (and ETag)
+    never changes.
+    """
+
+    def __init__(self, store, renderer=None, width=800, height=400):
+        self.store = store
+        self.renderer = renderer or RENDERERS[os.getenv("VISUAL_RENDERER", "procedural")]()
+        self.width = width
+        self.height = height
+        self._inflight = SingleFlight()
+
+    def visual_for(self, prompt, mood=None):
+        """Return the stored file name for a prompt, rendering it on first request."""
+        # The file name is derived from exactly what gets drawn, so one name
+        # always means the same bytes (its ETag is marked immutable)
+        prompt = " ".join(prompt.split())
+        if not mood:
+            from dream_classifier import classify_mood
+
+            # Pick a palette from the prompt itself when the client gives no mood.
+            guess, confidence = classify_mood(prompt)
+            mood = guess if confidence >= 0.5 else None
+        key = hashlib.sha256(json.dumps(
+            [self.renderer.name, prompt, mood, self.width, self.height]).encode("utf-8"))
+        filename = f"{key.hexdigest()[:32]}.{self.renderer.extension}"
+        if not self.store.touch(filename):
+            self._inflight.do(filename, lambda: self.store.put(
+                filename, self.renderer.render(prompt, mood, self.width, self.height)))
+        return filename
+
+
+def content_type(filename):
+    return CONTENT_TYPES[filename.rsplit(".", 1)[1]]